@@ -7,7 +7,7 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any, Union, FrozenSet
 from telegram import File
 from telegram.ext import ContextTypes
 from loguru import logger
@@ -16,6 +16,12 @@ from loguru import logger
 class BaseBot(ABC):
     """Абстрактный базовый класс для всех ботов в системе"""
     
+    # Ключевые слова (основы слов), по которым маршрутизатор направляет сообщения боту
+    keywords: FrozenSet[str] = frozenset()
+    
+    # Префикс прямого обращения к боту ("поэт, ..."), None - обращение не поддерживается
+    direct_prefix: Optional[str] = None
+    
     def __init__(self, name: str, description: str = ""):
         """Инициализация базового бота
         
@@ -38,37 +44,39 @@ class BaseBot(ABC):
         self.manager = manager
         logger.debug(f"Бот {self.name} привязан к менеджеру")
     
-    def initialize(self):
+    async def initialize(self):
         """Инициализация бота перед запуском"""
         if self.is_initialized:
             logger.warning(f"Бот {self.name} уже инициализирован")
             return
         
-        self._initialize_bot()
+        await self._initialize_bot()
         self.is_initialized = True
         logger.info(f"Бот {self.name} инициализирован")
     
-    def shutdown(self):
+    async def shutdown(self):
         """Корректное завершение работы бота"""
         if not self.is_initialized:
             logger.warning(f"Бот {self.name} не был инициализирован")
             return
         
-        self._shutdown_bot()
+        await self._shutdown_bot()
         self.is_initialized = False
         logger.info(f"Бот {self.name} остановлен")
     
     @abstractmethod
-    async def process_text(self, user_id: int, text: str, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+    async def process_text(self, user_id: int, text: str, context: ContextTypes.DEFAULT_TYPE,
+                           chat_id: Optional[int] = None) -> Optional[str]:
         """Обработка текстового сообщения
         
         Args:
             user_id: ID пользователя
             text: Текст сообщения
             context: Контекст Telegram
+            chat_id: ID чата, из которого пришло сообщение (по умолчанию - личный чат с пользователем)
             
         Returns:
-            Ответ на сообщение или None, если ответ не требуется
+            Ответ на сообщение или None, если ответ не требуется или бот уже отправил его сам
         """
         pass
     
@@ -87,12 +95,12 @@ class BaseBot(ABC):
         pass
     
     @abstractmethod
-    def _initialize_bot(self):
+    async def _initialize_bot(self):
         """Внутренний метод инициализации бота"""
         pass
     
     @abstractmethod
-    def _shutdown_bot(self):
+    async def _shutdown_bot(self):
         """Внутренний метод завершения работы бота"""
         pass
     
@@ -7,9 +7,13 @@
 """
 
 import os
+import asyncio
+import hashlib
 import tempfile
-from typing import Optional, Dict, Any, Union
+from io import BytesIO
+from typing import Optional, Dict, Any, Union, AsyncIterator
 from pathlib import Path
+import httpx
 from telegram import File
 from telegram.ext import ContextTypes
 from loguru import logger
@@ -17,12 +21,27 @@ from loguru import logger
 from bots.base_bot import BaseBot
 from bots.main_bot.voice_handler import VoiceHandler
 from bots.main_bot.tts_generator import TTSGenerator
-from services.ai_service import AIService
+from services._singletons import get_ai_service
+
+# Размер фрагмента при потоковом скачивании голосового сообщения
+VOICE_DOWNLOAD_CHUNK_SIZE = 32768
+
+# Размер файла, начиная с которого речь распознается инкрементально (~30 секунд голоса Opus)
+LONG_VOICE_FILE_SIZE = 120 * 1024
+
+# Максимальное количество голосовых ответов, сохраняемых в кэше между запусками
+TTS_CACHE_MAX_FILES = int(os.getenv("TTS_CACHE_MAX_FILES", "200"))
+
+# Минимальный интервал между правками сообщения при потоковом ответе (в секундах):
+# Telegram ограничивает частоту редактирования сообщений в одном чате
+STREAM_EDIT_INTERVAL = 1.0
 
 
 class MainBot(BaseBot):
     """Главный бот для обработки голосовых сообщений и координации работы системы"""
     
+    direct_prefix = "главный бот"
+    
     def __init__(self, name: str, description: str = ""):
         """Инициализация главного бота
         
@@ -34,24 +53,44 @@ class MainBot(BaseBot):
         self.voice_handler = None
         self.tts_generator = None
         self.ai_service = None
+        self._warmup_task = None
+        
+        # HTTP-клиент для скачивания голосовых сообщений (создается при первом запросе
+        # и переиспользует соединения с серверами Telegram)
+        self._http: Optional[httpx.AsyncClient] = None
         self.temp_dir = Path(tempfile.gettempdir()) / "telegram_bot_voice"
         self.temp_dir.mkdir(exist_ok=True)
     
-    def _initialize_bot(self):
+    async def _initialize_bot(self):
         """Инициализация компонентов бота"""
-        # Инициализация обработчика голосовых сообщений
-        self.voice_handler = VoiceHandler()
+        # Обработчик голосовых сообщений, генератор голосовых ответов и сервис ИИ
+        # создаются параллельно; сервис ИИ общий для всех ботов
+        self.voice_handler, self.tts_generator, self.ai_service = await asyncio.gather(
+            VoiceHandler.create(),
+            TTSGenerator.create(),
+            get_ai_service()
+        )
         
-        # Инициализация генератора голосовых ответов
-        self.tts_generator = TTSGenerator()
-        
-        # Инициализация сервиса ИИ
-        self.ai_service = AIService()
+        # Прогреваем распознавание и синтез речи в фоне, чтобы первый запрос не ждал
+        self._warmup_task = asyncio.create_task(self._warmup_all())
         
         logger.info(f"Главный бот {self.name} инициализирован")
     
-    def _shutdown_bot(self):
+    async def _warmup_all(self):
+        """Прогрев компонентов обработки голоса"""
+        await asyncio.gather(self.voice_handler.warmup(), self.tts_generator.warmup())
+    
+    async def _shutdown_bot(self):
         """Завершение работы бота"""
+        # Останавливаем прогрев, если он еще идет
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        
+        # Закрываем HTTP-клиент и его соединения
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        
         # Освобождение ресурсов
         if self.voice_handler:
             self.voice_handler.cleanup()
@@ -59,35 +98,81 @@ class MainBot(BaseBot):
         if self.tts_generator:
             self.tts_generator.cleanup()
         
-        if self.ai_service:
-            self.ai_service.cleanup()
+        # Удаление временных файлов с сохранением недавно использованных голосовых ответов
+        with os.scandir(self.temp_dir) as entries:
+            files = [entry for entry in entries if entry.is_file()]
+        # Время использования хранится в mtime (обновляется при попадании в кэш):
+        # atime на смонтированных с relatime/noatime файловых системах не обновляется
+        cached = sorted(
+            (entry for entry in files if entry.name.startswith("tts_")),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        keep = {entry.path for entry in cached[:TTS_CACHE_MAX_FILES]}
         
-        # Удаление временных файлов
-        for file in self.temp_dir.glob("*"):
+        for entry in files:
+            if entry.path in keep:
+                continue
             try:
-                file.unlink()
-            except Exception as e:
-                logger.error(f"Ошибка при удалении временного файла {file}: {e}")
+                os.unlink(entry.path)
+            except OSError as e:
+                logger.error(f"Ошибка при удалении временного файла {entry.path}: {e}")
         
         logger.info(f"Главный бот {self.name} остановлен")
     
-    async def process_text(self, user_id: int, text: str, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+    async def process_text(self, user_id: int, text: str, context: ContextTypes.DEFAULT_TYPE,
+                           chat_id: Optional[int] = None) -> Optional[str]:
         """Обработка текстового сообщения
         
         Args:
             user_id: ID пользователя
             text: Текст сообщения
             context: Контекст Telegram
+            chat_id: ID чата, из которого пришло сообщение (по умолчанию - личный чат с пользователем)
             
         Returns:
-            Ответ на сообщение или None, если ответ не требуется
+            Ответ на сообщение или None, если ответ не требуется или бот уже отправил его сам
         """
         logger.info(f"Обработка текстового сообщения от пользователя {user_id}: {text[:50]}...")
         
+        # Частичный ответ показывается одним сообщением в чате пользователя, которое
+        # дополняется по мере генерации; в этом случае метод сам отправляет ответ и возвращает None
+        if chat_id is None:
+            chat_id = user_id
+        loop = asyncio.get_running_loop()
+        message = None
+        shown_text = ""
+        last_edit = 0.0
+        
+        async def on_chunk(partial: str):
+            nonlocal message, shown_text, last_edit
+            now = loop.time()
+            if message is not None and now - last_edit < STREAM_EDIT_INTERVAL:
+                return
+            if message is None:
+                message = await context.bot.send_message(chat_id=chat_id, text=partial)
+            else:
+                await message.edit_text(partial)
+            shown_text = partial
+            last_edit = now
+        
         try:
             # Получение ответа от ИИ
-            response = await self.ai_service.get_text_response(user_id, text)
-            return response
+            response = await self.ai_service.get_text_response(user_id, text, on_chunk=on_chunk)
+            
+            # Ответ не передавался по частям (кэш, локальная модель, короткий ответ):
+            # его отправляет вызывающий код
+            if message is None:
+                return response
+            
+            # Ответ уже показан частично: дописываем его в то же сообщение
+            if response and response != shown_text:
+                try:
+                    await message.edit_text(response)
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении потокового ответа: {e}")
+                    return response
+            return None
         except Exception as e:
             logger.error(f"Ошибка при обработке текстового сообщения: {e}")
             return "Извините, произошла ошибка при обработке вашего сообщения. Попробуйте позже."
@@ -106,12 +191,16 @@ class MainBot(BaseBot):
         logger.info(f"Обработка голосового сообщения от пользователя {user_id}")
         
         try:
-            # Создаем временный файл для сохранения голосового сообщения
-            voice_path = self.temp_dir / f"voice_{user_id}_{voice_file.file_unique_id}.ogg"
-            await voice_file.download_to_drive(voice_path)
-            
-            # Преобразуем голосовое сообщение в текст
-            text = await self.voice_handler.speech_to_text(voice_path)
+            if str(voice_file.file_path).startswith("http"):
+                # Скачиваем голосовое сообщение и одновременно преобразуем его в текст
+                # Длинные сообщения распознаются инкрементально, не дожидаясь конца файла
+                is_long = (voice_file.file_size or 0) >= LONG_VOICE_FILE_SIZE
+                text = await self.voice_handler.speech_to_text_stream(self._iter_voice_file(voice_file), streaming=is_long)
+            else:
+                # Локальный Bot API сервер отдает путь к файлу, а не URL: читаем его в память
+                buffer = BytesIO()
+                await voice_file.download_to_memory(out=buffer)
+                text = await self.voice_handler.speech_to_text(buffer)
             if not text:
                 return "Извините, не удалось распознать голосовое сообщение. Попробуйте еще раз."
             
@@ -133,6 +222,23 @@ class MainBot(BaseBot):
             logger.error(f"Ошибка при обработке голосового сообщения: {e}")
             return "Извините, произошла ошибка при обработке вашего голосового сообщения. Попробуйте позже."
     
+    async def _iter_voice_file(self, voice_file: File) -> AsyncIterator[bytes]:
+        """Потоковое скачивание голосового файла из Telegram
+        
+        Args:
+            voice_file: Объект голосового файла
+            
+        Yields:
+            Фрагменты голосового файла
+        """
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient()
+        
+        async with self._http.stream("GET", voice_file.file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(VOICE_DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+    
     async def generate_voice_response(self, text: str, user_id: int) -> Optional[str]:
         """Генерация голосового ответа из текста
         
@@ -144,8 +250,13 @@ class MainBot(BaseBot):
             Путь к файлу с голосовым ответом или None в случае ошибки
         """
         try:
-            # Создаем временный файл для голосового ответа
-            voice_path = self.temp_dir / f"generated_voice_{user_id}_{hash(text)}.ogg"
+            # Имя файла определяется содержимым, поэтому одинаковые тексты берутся из кэша
+            voice_path = self.temp_dir / f"tts_{self._cache_key(text, self.tts_generator.voice)}.ogg"
+            if voice_path.exists() and voice_path.stat().st_size > 0:
+                # Отмечаем использование для вытеснения давно не использованных ответов
+                os.utime(voice_path)
+                logger.debug(f"Голосовой ответ найден в кэше: {voice_path}")
+                return str(voice_path)
             
             # Преобразуем текст в голос
             success = await self.tts_generator.text_to_speech(text, voice_path)
@@ -158,4 +269,17 @@ class MainBot(BaseBot):
         
         except Exception as e:
             logger.error(f"Ошибка при генерации голосового ответа: {e}")
-            return None
\ No newline at end of file
+            return None
+    
+    @staticmethod
+    def _cache_key(text: str, voice: str) -> str:
+        """Стабильный ключ кэша голосового ответа
+        
+        Args:
+            text: Текст ответа
+            voice: Идентификатор голоса
+            
+        Returns:
+            Хэш текста и голоса в шестнадцатеричном виде
+        """
+        return hashlib.blake2b(f"{voice}|{text}".encode("utf-8"), digest_size=16).hexdigest()
\ No newline at end of file
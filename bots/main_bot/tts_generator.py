@@ -7,15 +7,43 @@
 """
 
 import os
+import re
+import json
+import time
+import shutil
 import tempfile
 from pathlib import Path
 import asyncio
-from typing import Optional
+from typing import Optional, AsyncIterator, List, Dict, Any
 from loguru import logger
 
 # Используем edge-tts как бесплатную альтернативу для генерации голоса
 import edge_tts
 
+# Быстрая сериализация JSON (необязательная зависимость, иначе используется стандартный json)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.warning("Библиотека orjson не установлена. Будет использован стандартный модуль json.")
+
+# Граница предложений для параллельного синтеза
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+# Тексты короче этого порога синтезируются одним запросом
+MIN_SPLIT_LENGTH = 120
+
+# Время жизни кэша списка голосов (в секундах)
+VOICES_CACHE_TTL = 3600
+
+# Максимальное количество одновременно синтезируемых предложений (соединений с edge-tts)
+TTS_MAX_CONCURRENCY = 4
+
+# Кэш списка голосов на диске: хранится вне временной директории, которая удаляется
+# при остановке, чтобы переживать перезапуски
+VOICES_CACHE_PATH = Path(os.getenv("XDG_CACHE_HOME", str(Path.home() / ".cache"))) / "telegram_bot" / "voices.json"
+
 
 class TTSGenerator:
     """Класс для генерации голосовых ответов из текста"""
@@ -27,8 +55,27 @@ class TTSGenerator:
         
         # Настройки голоса (русский женский голос)
         self.voice = "ru-RU-SvetlanaNeural"
+        
+        # Кэш списка доступных голосов
+        self._voices_cache_path = VOICES_CACHE_PATH
+        self._voices_cache: Optional[List[Dict[str, Any]]] = None
+        self._voices_cache_ts = 0.0
+        self._load_voices_cache()
+        
+        # Ограничение одновременных запросов к edge-tts (создается внутри цикла событий)
+        self._synth_sem: Optional[asyncio.Semaphore] = None
+        
         logger.info("Генератор голосовых ответов инициализирован")
     
+    @classmethod
+    async def create(cls) -> "TTSGenerator":
+        """Асинхронное создание генератора голосовых ответов без блокировки цикла событий
+        
+        Returns:
+            Экземпляр генератора голосовых ответов
+        """
+        return await asyncio.to_thread(cls)
+    
     async def text_to_speech(self, text: str, output_path: Path) -> bool:
         """Преобразование текста в голосовое сообщение
         
@@ -39,19 +86,99 @@ class TTSGenerator:
         Returns:
             True в случае успеха, False в случае ошибки
         """
+        # Аудио пишется во временный файл и переносится на место только целиком: иначе
+        # прерванный синтез оставил бы обрезанный файл, который кэш отдавал бы как готовый
+        tmp_path = output_path.with_name(f"{output_path.name}.{os.urandom(4).hex()}.tmp")
         try:
-            # Создаем коммуникатор для edge-tts
-            communicate = edge_tts.Communicate(text, self.voice)
+            sentences = self._split_sentences(text)
             
-            # Преобразуем текст в речь и сохраняем в файл
-            await communicate.save(str(output_path))
+            if len(sentences) == 1:
+                # Записываем аудио в файл по мере получения фрагментов от edge-tts
+                with open(tmp_path, "wb") as file:
+                    async for chunk in self.text_to_speech_stream(text):
+                        file.write(chunk)
+            else:
+                # Синтезируем предложения параллельно и записываем их по порядку по мере готовности
+                tasks = [asyncio.create_task(self._synthesize(sentence)) for sentence in sentences]
+                try:
+                    with open(tmp_path, "wb") as file:
+                        for task in tasks:
+                            file.write(await task)
+                finally:
+                    for task in tasks:
+                        task.cancel()
             
+            os.replace(tmp_path, output_path)
             logger.info(f"Голосовое сообщение успешно создано: {output_path}")
             return True
         
         except Exception as e:
             logger.error(f"Ошибка при создании голосового сообщения: {e}")
             return False
+        
+        finally:
+            # После успешного переноса временного файла уже нет
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+    
+    async def text_to_speech_stream(self, text: str) -> AsyncIterator[bytes]:
+        """Потоковое преобразование текста в голос
+        
+        Args:
+            text: Текст для преобразования
+            
+        Yields:
+            Фрагменты аудио по мере их синтеза
+        """
+        # Создаем коммуникатор для edge-tts
+        communicate = edge_tts.Communicate(text, self.voice)
+        
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
+    
+    async def warmup(self):
+        """Прогрев edge-tts: устанавливаем соединение до первого запроса пользователя"""
+        try:
+            stream = self.text_to_speech_stream("ок")
+            async for _ in stream:
+                break
+            await stream.aclose()
+            logger.info("Генератор голосовых ответов прогрет")
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть генератор голосовых ответов: {e}")
+    
+    async def _synthesize(self, text: str) -> bytes:
+        """Синтез фрагмента текста целиком в память
+        
+        Args:
+            text: Текст для преобразования
+            
+        Returns:
+            Аудиоданные фрагмента
+        """
+        # Длинный ответ не открывает соединение на каждое предложение сразу
+        if self._synth_sem is None:
+            self._synth_sem = asyncio.Semaphore(TTS_MAX_CONCURRENCY)
+        async with self._synth_sem:
+            return b"".join([chunk async for chunk in self.text_to_speech_stream(text)])
+    
+    def _split_sentences(self, text: str) -> List[str]:
+        """Разбиение текста на предложения для параллельного синтеза
+        
+        Args:
+            text: Исходный текст
+            
+        Returns:
+            Список предложений (один элемент для коротких текстов)
+        """
+        if len(text) < MIN_SPLIT_LENGTH:
+            return [text]
+        
+        sentences = [sentence for sentence in SENTENCE_SPLIT_PATTERN.split(text.strip()) if sentence]
+        return sentences or [text]
     
     def set_voice(self, voice: str):
         """Установка голоса для генерации
@@ -68,27 +195,51 @@ class TTSGenerator:
         Returns:
             Список доступных голосов
         """
+        # Возвращаем кэшированный список, если он еще актуален
+        if self._voices_cache is not None and time.time() - self._voices_cache_ts < VOICES_CACHE_TTL:
+            return self._voices_cache
+        
         try:
             # Получаем список доступных голосов
             voices = await edge_tts.list_voices()
+            self._voices_cache = voices
+            self._voices_cache_ts = time.time()
+            
+            # Сохраняем список на диск для следующих запусков
+            try:
+                self._voices_cache_path.parent.mkdir(parents=True, exist_ok=True)
+                if ORJSON_AVAILABLE:
+                    self._voices_cache_path.write_bytes(orjson.dumps(voices))
+                else:
+                    self._voices_cache_path.write_text(json.dumps(voices, ensure_ascii=False), encoding="utf-8")
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении кэша списка голосов: {e}")
+            
             return voices
         except Exception as e:
             logger.error(f"Ошибка при получении списка голосов: {e}")
-            return []
+            # При ошибке сети отдаем устаревший кэш, если он есть
+            return self._voices_cache or []
     
-    def cleanup(self):
-        """Очистка временных файлов и ресурсов"""
+    def _load_voices_cache(self):
+        """Загрузка списка голосов из кэша на диске, если он еще актуален"""
         try:
-            # Удаляем все временные файлы
-            for file in self.temp_dir.glob("*"):
-                try:
-                    file.unlink()
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении временного файла {file}: {e}")
+            if not self._voices_cache_path.exists():
+                return
             
-            # Удаляем временную директорию
-            self.temp_dir.rmdir()
-            logger.info("Временные файлы генератора голосовых ответов удалены")
-        
+            mtime = self._voices_cache_path.stat().st_mtime
+            if time.time() - mtime >= VOICES_CACHE_TTL:
+                return
+            
+            data = self._voices_cache_path.read_bytes()
+            self._voices_cache = orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+            self._voices_cache_ts = mtime
+            logger.debug("Список голосов загружен из кэша")
         except Exception as e:
-            logger.error(f"Ошибка при очистке ресурсов генератора голосовых ответов: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка при загрузке кэша списка голосов: {e}")
+    
+    def cleanup(self):
+        """Очистка временных файлов и ресурсов"""
+        # Удаляем временную директорию вместе со всеми файлами
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logger.info("Временные файлы генератора голосовых ответов удалены")
\ No newline at end of file
@@ -7,12 +7,55 @@
 """
 
 import os
+import asyncio
+import bisect
+import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from io import BytesIO
+from typing import AsyncIterator, List, Optional, Tuple, Union
 import speech_recognition as sr
-from pydub import AudioSegment
 from loguru import logger
 
+# Для локального распознавания речи (бесплатный вариант без сетевых запросов)
+try:
+    import numpy as np
+    import ctranslate2
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+    WHISPER_AVAILABLE = True
+except ImportError:
+    WHISPER_AVAILABLE = False
+    logger.warning("Библиотека faster-whisper не установлена. Будет использован Google Speech Recognition.")
+
+
+# Максимальное количество одновременных операций распознавания
+STT_MAX_WORKERS = int(os.getenv("STT_MAX_WORKERS", "4"))
+
+# Параметры PCM, в который декодируется голосовое сообщение (16 кГц, моно, int16)
+PCM_SAMPLE_RATE = 16000
+PCM_SAMPLE_WIDTH = 2
+
+# Движок распознавания речи: "whisper" (локальный) или "google" (облачный)
+STT_ENGINE = os.getenv("STT_ENGINE", "whisper").lower()
+
+# Размер модели Whisper и размер пакета для BatchedInferencePipeline
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+
+# Окно (в секундах), в течение которого запросы разных пользователей собираются в один пакет
+STT_BATCH_WINDOW = float(os.getenv("STT_BATCH_WINDOW", "0.05"))
+
+# Максимальная длина фрагмента, который Whisper обрабатывает за один проход (в секундах)
+WHISPER_CHUNK_SECONDS = 30
+
+# Потоковое распознавание: шаг между проходами и перекрытие с подтвержденным текстом (в секундах)
+WHISPER_STREAM_STEP = float(os.getenv("WHISPER_STREAM_STEP", "2.0"))
+WHISPER_STREAM_CARRYOVER = 0.2
+
+# Размер порции PCM, читаемой из ffmpeg (1 секунда звука)
+PCM_READ_SIZE = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH
+
 
 class VoiceHandler:
     """Класс для обработки голосовых сообщений"""
@@ -22,33 +65,441 @@ class VoiceHandler:
         self.recognizer = sr.Recognizer()
         self.temp_dir = Path(tempfile.gettempdir()) / "telegram_bot_voice_processing"
         self.temp_dir.mkdir(exist_ok=True)
+        
+        # Пул потоков для блокирующих операций распознавания
+        self._executor = ThreadPoolExecutor(max_workers=STT_MAX_WORKERS, thread_name_prefix="stt")
+        
+        # Локальная модель Whisper
+        self.model = None
+        self.batched = None
+        self._initialize_whisper()
+        
+        # Очередь запросов на распознавание и фоновая задача, собирающая их в пакеты
+        self._pending: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        
         logger.info("Обработчик голосовых сообщений инициализирован")
     
-    async def speech_to_text(self, voice_path: Path) -> str:
+    @classmethod
+    async def create(cls) -> "VoiceHandler":
+        """Асинхронное создание обработчика голосовых сообщений без блокировки цикла событий
+        
+        Returns:
+            Экземпляр обработчика голосовых сообщений
+        """
+        return await asyncio.to_thread(cls)
+    
+    def _initialize_whisper(self):
+        """Инициализация локальной модели Whisper"""
+        if STT_ENGINE != "whisper" or not WHISPER_AVAILABLE:
+            logger.info("Для распознавания речи используется Google Speech Recognition")
+            return
+        
+        try:
+            # Используем GPU, если он доступен
+            use_cuda = ctranslate2.get_cuda_device_count() > 0
+            device = "cuda" if use_cuda else "cpu"
+            compute_type = "float16" if use_cuda else "int8"
+            
+            logger.info(f"Загрузка модели Whisper ({WHISPER_MODEL_SIZE}, {device}, {compute_type})...")
+            self.model = WhisperModel(WHISPER_MODEL_SIZE, device=device, compute_type=compute_type)
+            self.batched = BatchedInferencePipeline(model=self.model)
+            logger.info("Модель Whisper успешно загружена")
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке модели Whisper: {e}. Будет использован Google Speech Recognition.")
+            self.model = None
+            self.batched = None
+    
+    async def warmup(self):
+        """Прогрев локальной модели распознавания на секунде тишины"""
+        if not self.batched:
+            return
+        
+        try:
+            silence = bytes(PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._recognize_whisper_batch, [silence])
+            logger.info("Модель Whisper прогрета")
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть модель Whisper: {e}")
+    
+    async def speech_to_text(self, voice: Union[Path, bytes, BytesIO]) -> str:
         """Преобразование голосового сообщения в текст
         
         Args:
-            voice_path: Путь к файлу с голосовым сообщением
+            voice: Путь к файлу с голосовым сообщением или его содержимое в памяти
+            
+        Returns:
+            Распознанный текст или пустая строка в случае ошибки
+        """
+        try:
+            # Декодируем OGG напрямую в PCM без промежуточного WAV-файла
+            if isinstance(voice, (bytes, BytesIO)):
+                data = voice.getvalue() if isinstance(voice, BytesIO) else voice
+                pcm = await self._decode_to_pcm("pipe:0", self._iter_bytes(data))
+            else:
+                pcm = await self._decode_to_pcm(str(voice))
+            return await self._recognize_pcm(pcm)
+        
+        except Exception as e:
+            logger.error(f"Ошибка при распознавании речи: {e}")
+            return ""
+    
+    async def speech_to_text_stream(self, chunks: AsyncIterator[bytes], streaming: bool = False) -> str:
+        """Преобразование голосового сообщения в текст по мере его скачивания
+        
+        Декодирование в ffmpeg идет параллельно со скачиванием, поэтому к концу
+        загрузки файла PCM уже почти готов.
+        
+        Args:
+            chunks: Асинхронный итератор фрагментов голосового файла
+            streaming: Распознавать ли речь инкрементально, не дожидаясь конца файла
+            
+        Returns:
+            Распознанный текст или пустая строка в случае ошибки
+        """
+        try:
+            if streaming and self.model:
+                return await self.speech_to_text_streaming(self._iter_pcm("pipe:0", chunks))
+            
+            pcm = await self._decode_to_pcm("pipe:0", chunks)
+            return await self._recognize_pcm(pcm)
+        
+        except Exception as e:
+            logger.error(f"Ошибка при потоковом распознавании речи: {e}")
+            return ""
+    
+    async def speech_to_text_streaming(self, pcm_chunks: AsyncIterator[bytes]) -> str:
+        """Инкрементальное распознавание речи по мере поступления PCM
+        
+        Каждый проход Whisper обрабатывает только неподтвержденный хвост буфера,
+        начиная с конца последнего подтвержденного слова минус небольшое перекрытие.
+        Слово подтверждается, когда два последовательных прохода с ним согласны
+        (LocalAgreement), а последнее подтвержденное слово передается как
+        initial_prompt, чтобы модель продолжала фразу с середины.
+        
+        Args:
+            pcm_chunks: Асинхронный итератор PCM-данных (16 кГц, моно, int16)
+            
+        Returns:
+            Распознанный текст или пустая строка в случае ошибки
+        """
+        if not self.model:
+            pcm = b"".join([chunk async for chunk in pcm_chunks])
+            return await self._recognize_pcm(pcm)
+        
+        loop = asyncio.get_running_loop()
+        step_bytes = int(WHISPER_STREAM_STEP * PCM_SAMPLE_RATE) * PCM_SAMPLE_WIDTH
+        max_buffer_bytes = WHISPER_CHUNK_SECONDS * PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH
+        carryover_bytes = int(WHISPER_STREAM_CARRYOVER * PCM_SAMPLE_RATE) * PCM_SAMPLE_WIDTH
+        
+        # Состояние текущего потока (у каждого сообщения свое)
+        committed: List[str] = []
+        previous: List[str] = []
+        buffer = bytearray()
+        new_bytes = 0
+        
+        async for chunk in pcm_chunks:
+            buffer += chunk
+            new_bytes += len(chunk)
+            if new_bytes < step_bytes:
+                continue
+            new_bytes = 0
+            
+            # Буфер содержит только неподтвержденный хвост (от последнего подтвержденного
+            # слова минус перекрытие); проход видит не больше окна Whisper
+            window_start = max(len(buffer) - max_buffer_bytes, 0)
+            prompt = committed[-1] if committed else None
+            words = await loop.run_in_executor(
+                self._executor, self._transcribe_window, bytes(buffer[window_start:]), prompt
+            )
+            words = self._drop_carryover(words, committed)
+            
+            # Подтверждаем общий префикс с предыдущим проходом
+            agreed = 0
+            while (agreed < len(words) and agreed < len(previous)
+                   and self._normalize_word(words[agreed][0]) == self._normalize_word(previous[agreed])):
+                agreed += 1
+            
+            if len(buffer) >= max_buffer_bytes:
+                # Окно заполнено: подтверждаем все распознанное и отбрасываем звук до перекрытия,
+                # даже если слов нет (тишина, шум, музыка), иначе буфер растет без ограничений
+                committed.extend(word for word, _ in words)
+                del buffer[:len(buffer) - carryover_bytes]
+                agreed = len(words)
+            elif agreed:
+                committed.extend(word for word, _ in words[:agreed])
+                cut_time = max(words[agreed - 1][1] - WHISPER_STREAM_CARRYOVER, 0.0)
+                del buffer[:window_start + int(cut_time * PCM_SAMPLE_RATE) * PCM_SAMPLE_WIDTH]
+            
+            previous = [word for word, _ in words[agreed:]]
+        
+        # Дораспознаем оставшийся хвост
+        if buffer:
+            prompt = committed[-1] if committed else None
+            words = await loop.run_in_executor(self._executor, self._transcribe_window, bytes(buffer), prompt)
+            committed.extend(word for word, _ in self._drop_carryover(words, committed))
+        
+        text = " ".join(committed).strip()
+        if text:
+            logger.info(f"Распознан текст: {text[:50]}...")
+        else:
+            logger.warning("Whisper не смог распознать аудио")
+        return text
+    
+    def _transcribe_window(self, pcm: bytes, prompt: Optional[str]) -> List[Tuple[str, float]]:
+        """Синхронное распознавание окна потокового буфера
+        
+        Args:
+            pcm: PCM-данные окна (16 кГц, моно, int16)
+            prompt: Последнее подтвержденное слово для продолжения фразы
+            
+        Returns:
+            Список слов с временем их окончания относительно начала окна
+        """
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        segments, _ = self.model.transcribe(
+            audio,
+            language="ru",
+            initial_prompt=prompt,
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            vad_filter=False
+        )
+        return [(word.word.strip(), word.end) for segment in segments for word in (segment.words or [])]
+    
+    def _drop_carryover(self, words: List[Tuple[str, float]], committed: List[str]) -> List[Tuple[str, float]]:
+        """Удаление слова, повторно распознанного из перекрытия с подтвержденным текстом"""
+        if words and committed and self._normalize_word(words[0][0]) == self._normalize_word(committed[-1]):
+            return words[1:]
+        return words
+    
+    @staticmethod
+    def _normalize_word(word: str) -> str:
+        """Нормализация слова для сравнения гипотез"""
+        return word.strip().lower().strip(".,!?;:…\"'«»-")
+    
+    async def _recognize_pcm(self, pcm: bytes) -> str:
+        """Распознавание речи из PCM выбранным движком
+        
+        Args:
+            pcm: PCM-данные (16 кГц, моно, int16)
+            
+        Returns:
+            Распознанный текст или пустая строка в случае ошибки
+        """
+        if not pcm:
+            return ""
+        
+        # Локальная модель обрабатывает запросы пакетами через общую очередь
+        if self.batched:
+            return await self._enqueue_for_batch(pcm)
+        
+        # Выполняем распознавание в пуле потоков, чтобы не блокировать цикл событий
+        loop = asyncio.get_running_loop()
+        audio_data = sr.AudioData(pcm, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH)
+        return await loop.run_in_executor(self._executor, self._recognize, audio_data)
+    
+    async def _decode_to_pcm(self, source: str, chunks: Optional[AsyncIterator[bytes]] = None) -> bytes:
+        """Декодирование голосового сообщения в сырой PCM с помощью ffmpeg
+        
+        Args:
+            source: Путь к файлу или "pipe:0" для чтения из stdin
+            chunks: Фрагменты файла, передаваемые в stdin ffmpeg (если source == "pipe:0")
+            
+        Returns:
+            PCM-данные (16 кГц, моно, int16) или пустые байты в случае ошибки
+        """
+        try:
+            return b"".join([pcm async for pcm in self._iter_pcm(source, chunks)])
+        except RuntimeError as e:
+            logger.error(f"Ошибка при декодировании аудио через ffmpeg: {e}")
+            return b""
+    
+    @staticmethod
+    async def _iter_bytes(data: bytes) -> AsyncIterator[bytes]:
+        """Представление содержимого файла в памяти в виде потока фрагментов"""
+        yield data
+    
+    async def _iter_pcm(self, source: str, chunks: Optional[AsyncIterator[bytes]] = None) -> AsyncIterator[bytes]:
+        """Потоковое декодирование голосового сообщения в PCM с помощью ffmpeg
+        
+        Args:
+            source: Путь к файлу или "pipe:0" для чтения из stdin
+            chunks: Фрагменты файла, передаваемые в stdin ffmpeg (если source == "pipe:0")
+            
+        Yields:
+            Порции PCM-данных (16 кГц, моно, int16) по мере декодирования
+        """
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-loglevel", "error",
+            "-i", source,
+            "-f", "s16le", "-ac", "1", "-ar", str(PCM_SAMPLE_RATE),
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE if chunks is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        async def feed():
+            # Передаем фрагменты в ffmpeg по мере их поступления
+            try:
+                async for chunk in chunks:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            finally:
+                process.stdin.close()
+        
+        feeder = asyncio.create_task(feed()) if chunks is not None else None
+        stderr_reader = asyncio.create_task(process.stderr.read())
+        
+        try:
+            while True:
+                pcm = await process.stdout.read(PCM_READ_SIZE)
+                if not pcm:
+                    break
+                yield pcm
+            
+            await process.wait()
+            if feeder:
+                # Пробрасываем ошибки скачивания
+                await feeder
+            stderr = await stderr_reader
+        
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            for task in (feeder, stderr_reader):
+                if task and not task.done():
+                    task.cancel()
+        
+        if process.returncode != 0:
+            raise RuntimeError(stderr.decode(errors="ignore").strip())
+    
+    async def _enqueue_for_batch(self, pcm: bytes) -> str:
+        """Постановка голосового сообщения в очередь пакетного распознавания
+        
+        Args:
+            pcm: PCM-данные (16 кГц, моно, int16)
+            
+        Returns:
+            Распознанный текст или пустая строка в случае ошибки
+        """
+        loop = asyncio.get_running_loop()
+        
+        # Очередь и обработчик создаются в работающем цикле событий
+        if self._pending is None:
+            self._pending = asyncio.Queue()
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_task = asyncio.create_task(self._batch_worker())
+        
+        future = loop.create_future()
+        await self._pending.put((pcm, future))
+        return await future
+    
+    async def _batch_worker(self):
+        """Фоновая задача, собирающая одновременные запросы в пакеты для Whisper"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            # Ждем первый запрос, затем добираем остальные в течение короткого окна
+            batch: List[Tuple[bytes, asyncio.Future]] = [await self._pending.get()]
+            deadline = loop.time() + STT_BATCH_WINDOW
+            
+            while len(batch) < WHISPER_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._pending.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            pcms = [pcm for pcm, _ in batch]
+            try:
+                texts = await loop.run_in_executor(self._executor, self._recognize_whisper_batch, pcms)
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном распознавании речи: {e}")
+                texts = [""] * len(batch)
+            
+            for (_, future), text in zip(batch, texts):
+                if not future.done():
+                    future.set_result(text)
+    
+    def _recognize_whisper_batch(self, pcms: List[bytes]) -> List[str]:
+        """Синхронное пакетное распознавание речи локальной моделью Whisper
+        
+        Все сообщения склеиваются в один сигнал, а границы каждого из них передаются
+        в clip_timestamps (в отсчетах сигнала), поэтому фрагменты разных пользователей
+        попадают в один пакет.
+        
+        Args:
+            pcms: Список PCM-данных (16 кГц, моно, int16)
+            
+        Returns:
+            Список распознанных текстов в том же порядке, что и pcms
+        """
+        try:
+            # Whisper принимает нормализованный float32-сигнал
+            audios = [np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0 for pcm in pcms]
+            
+            # Размечаем фрагменты не длиннее WHISPER_CHUNK_SECONDS внутри каждого сообщения.
+            # BatchedInferencePipeline вырезает фрагменты по номерам отсчетов, поэтому границы
+            # задаются в отсчетах; начала сообщений (offsets) хранятся в секундах, как и
+            # время начала сегментов
+            chunk_samples = WHISPER_CHUNK_SECONDS * PCM_SAMPLE_RATE
+            offsets = []
+            clip_timestamps = []
+            position = 0
+            for audio in audios:
+                offsets.append(position / PCM_SAMPLE_RATE)
+                for chunk_start in range(0, len(audio), chunk_samples):
+                    chunk_end = min(chunk_start + chunk_samples, len(audio))
+                    clip_timestamps.append({"start": position + chunk_start, "end": position + chunk_end})
+                position += len(audio)
+            
+            segments, _ = self.batched.transcribe(
+                np.concatenate(audios),
+                batch_size=min(len(clip_timestamps), WHISPER_BATCH_SIZE),
+                language="ru",
+                without_timestamps=True,
+                vad_filter=False,
+                clip_timestamps=clip_timestamps
+            )
+            
+            # Распределяем сегменты по сообщениям по времени начала
+            parts: List[List[str]] = [[] for _ in audios]
+            for segment in segments:
+                index = max(bisect.bisect_right(offsets, segment.start + 1e-3) - 1, 0)
+                parts[index].append(segment.text.strip())
+            
+            texts = [" ".join(part).strip() for part in parts]
+            for text in texts:
+                if text:
+                    logger.info(f"Распознан текст: {text[:50]}...")
+                else:
+                    logger.warning("Whisper не смог распознать аудио")
+            return texts
+        
+        except Exception as e:
+            logger.error(f"Ошибка при распознавании речи моделью Whisper: {e}")
+            return [""] * len(pcms)
+    
+    def _recognize(self, audio_data: sr.AudioData) -> str:
+        """Синхронное распознавание речи через Google Speech Recognition
+        
+        Args:
+            audio_data: Аудиоданные для распознавания
             
         Returns:
             Распознанный текст или пустая строка в случае ошибки
         """
         try:
-            # Конвертируем OGG в WAV для распознавания
-            wav_path = self.temp_dir / f"{voice_path.stem}.wav"
-            
-            # Используем pydub для конвертации
-            audio = AudioSegment.from_file(voice_path, format="ogg")
-            audio.export(wav_path, format="wav")
-            
-            # Распознаем речь
-            with sr.AudioFile(str(wav_path)) as source:
-                audio_data = self.recognizer.record(source)
-                
-                # Пытаемся распознать с помощью Google Speech Recognition (бесплатно с ограничениями)
-                text = self.recognizer.recognize_google(audio_data, language="ru-RU")
-                logger.info(f"Распознан текст: {text[:50]}...")
-                return text
+            # Пытаемся распознать с помощью Google Speech Recognition (бесплатно с ограничениями)
+            text = self.recognizer.recognize_google(audio_data, language="ru-RU")
+            logger.info(f"Распознан текст: {text[:50]}...")
+            return text
         
         except sr.UnknownValueError:
             logger.warning("Google Speech Recognition не смог распознать аудио")
@@ -61,28 +512,14 @@ class VoiceHandler:
         except Exception as e:
             logger.error(f"Ошибка при распознавании речи: {e}")
             return ""
-        
-        finally:
-            # Удаляем временный WAV-файл
-            if 'wav_path' in locals() and wav_path.exists():
-                try:
-                    wav_path.unlink()
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении временного файла {wav_path}: {e}")
     
     def cleanup(self):
         """Очистка временных файлов и ресурсов"""
-        try:
-            # Удаляем все временные файлы
-            for file in self.temp_dir.glob("*"):
-                try:
-                    file.unlink()
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении временного файла {file}: {e}")
-            
-            # Удаляем временную директорию
-            self.temp_dir.rmdir()
-            logger.info("Временные файлы обработчика голосовых сообщений удалены")
+        # Останавливаем обработчик очереди и пул потоков распознавания
+        if self._batch_task and not self._batch_task.done():
+            self._batch_task.cancel()
+        self._executor.shutdown(wait=False)
         
-        except Exception as e:
-            logger.error(f"Ошибка при очистке ресурсов обработчика голосовых сообщений: {e}")
\ No newline at end of file
+        # Удаляем временную директорию вместе со всеми файлами
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logger.info("Временные файлы обработчика голосовых сообщений удалены")
\ No newline at end of file
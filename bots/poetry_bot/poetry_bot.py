@@ -7,6 +7,9 @@
 """
 
 import os
+import re
+import asyncio
+import shutil
 import tempfile
 from typing import Optional, Dict, Any, Union
 from pathlib import Path
@@ -17,12 +20,21 @@ from loguru import logger
 from bots.base_bot import BaseBot
 from bots.poetry_bot.poetry_generator import PoetryGenerator
 from bots.poetry_bot.suno_integration import SunoIntegration
-from services.ai_service import AIService
+from services._singletons import get_ai_service
+
+# Ключевые слова запроса на создание музыки
+MUSIC_KEYWORDS_PATTERN = re.compile(r"музык|песн|трек|мелоди|suno", re.IGNORECASE)
 
 
 class PoetryBot(BaseBot):
     """Бот для создания креативных стихов и музыки"""
     
+    keywords = frozenset({
+        "стих", "поэм", "рифм", "строф", "сочини",
+        "музык", "песн", "трек", "мелоди", "suno"
+    })
+    direct_prefix = "поэт"
+    
     def __init__(self, name: str, description: str = ""):
         """Инициализация бота для стихов
         
@@ -37,64 +49,68 @@ class PoetryBot(BaseBot):
         self.temp_dir = Path(tempfile.gettempdir()) / "telegram_bot_poetry"
         self.temp_dir.mkdir(exist_ok=True)
     
-    def _initialize_bot(self):
+    async def _initialize_bot(self):
         """Инициализация компонентов бота"""
-        # Инициализация генератора стихов
-        self.poetry_generator = PoetryGenerator()
+        # Сервис ИИ (общий для всех ботов) и интеграция с Suno создаются параллельно
+        self.ai_service, self.suno_integration = await asyncio.gather(
+            get_ai_service(),
+            SunoIntegration.create()
+        )
         
-        # Инициализация интеграции с Suno
-        self.suno_integration = SunoIntegration()
-        
-        # Инициализация сервиса ИИ
-        self.ai_service = AIService()
+        # Инициализация генератора стихов
+        self.poetry_generator = PoetryGenerator(self.ai_service)
         
         logger.info(f"Бот для стихов {self.name} инициализирован")
     
-    def _shutdown_bot(self):
+    async def _shutdown_bot(self):
         """Завершение работы бота"""
         # Освобождение ресурсов
         if self.poetry_generator:
             self.poetry_generator.cleanup()
         
         if self.suno_integration:
-            self.suno_integration.cleanup()
+            await self.suno_integration.cleanup()
         
-        if self.ai_service:
-            self.ai_service.cleanup()
-        
-        # Удаление временных файлов
-        for file in self.temp_dir.glob("*"):
-            try:
-                file.unlink()
-            except Exception as e:
-                logger.error(f"Ошибка при удалении временного файла {file}: {e}")
+        # Удаление временных файлов (директория остается для повторной инициализации)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.temp_dir.mkdir(exist_ok=True)
         
         logger.info(f"Бот для стихов {self.name} остановлен")
     
-    async def process_text(self, user_id: int, text: str, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+    async def process_text(self, user_id: int, text: str, context: ContextTypes.DEFAULT_TYPE,
+                           chat_id: Optional[int] = None) -> Optional[str]:
         """Обработка текстового сообщения
         
         Args:
             user_id: ID пользователя
             text: Текст сообщения
             context: Контекст Telegram
+            chat_id: ID чата, из которого пришло сообщение (по умолчанию - личный чат с пользователем)
             
         Returns:
-            Ответ на сообщение или None, если ответ не требуется
+            Ответ на сообщение или None, если ответ не требуется или бот уже отправил его сам
         """
         logger.info(f"Обработка запроса на создание стиха от пользователя {user_id}: {text[:50]}...")
         
+        if chat_id is None:
+            chat_id = user_id
+        
         try:
             # Проверяем, содержит ли сообщение запрос на создание музыки
-            if any(keyword in text.lower() for keyword in ["музык", "песн", "трек", "мелоди", "suno"]):
-                # Отправляем уведомление о начале обработки
-                await context.bot.send_message(
-                    chat_id=user_id,
+            if MUSIC_KEYWORDS_PATTERN.search(text):
+                # Отправляем уведомление о начале обработки параллельно с генерацией стиха
+                notification = asyncio.create_task(context.bot.send_message(
+                    chat_id=chat_id,
                     text="Начинаю создание стиха и музыкального трека. Это может занять некоторое время..."
-                )
+                ))
                 
                 # Генерируем стих
-                poem = await self.poetry_generator.generate_poem(text)
+                poem_task = asyncio.create_task(self.poetry_generator.generate_poem(text))
+                try:
+                    poem = await poem_task
+                finally:
+                    # Ошибка отправки уведомления не должна прерывать создание трека
+                    await asyncio.gather(notification, return_exceptions=True)
                 
                 # Создаем промпт для Suno
                 suno_prompt = await self.suno_integration.create_suno_prompt(poem, text)
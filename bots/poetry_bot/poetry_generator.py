@@ -7,21 +7,46 @@
 """
 
 import os
+import re
+import asyncio
+import hashlib
+import shutil
 import tempfile
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from loguru import logger
 
 # Импортируем сервис ИИ для генерации стихов
-from services.ai_service import AIService
+from services.ai_service import AIService, CREATIVE_ERROR_RESPONSE
+
+# Фразы типа "напиши стих о", "сочини стихотворение про" и т.д., удаляемые из запроса
+PHRASES_TO_REMOVE = (
+    "напиши стих", "напиши стихотворение", "сочини стих", "сочини стихотворение",
+    "создай стих", "создай стихотворение", "придумай стих", "придумай стихотворение",
+    "поэт,", "@поэт", "стихотворение о", "стихотворение про", "стих о", "стих про"
+)
+
+# Все фразы удаляются за один проход; более длинные проверяются первыми,
+# чтобы "напиши стихотворение" не превращалось в "отворение"
+CLEAN_PROMPT_PATTERN = re.compile(
+    "|".join(re.escape(phrase) for phrase in sorted(PHRASES_TO_REMOVE, key=len, reverse=True))
+)
+
+# Максимальное количество стихотворений в кэше
+POEM_CACHE_MAX_SIZE = 256
 
 
 class PoetryGenerator:
     """Класс для генерации креативных стихов"""
     
-    def __init__(self):
-        """Инициализация генератора стихов"""
-        self.ai_service = AIService()
+    def __init__(self, ai_service: Optional[AIService] = None):
+        """Инициализация генератора стихов
+        
+        Args:
+            ai_service: Общий сервис ИИ (если не передан, создается собственный)
+        """
+        self.ai_service = ai_service or AIService()
         self.temp_dir = Path(tempfile.gettempdir()) / "telegram_bot_poetry_generator"
         self.temp_dir.mkdir(exist_ok=True)
         
@@ -34,6 +59,11 @@ class PoetryGenerator:
             "Сочини короткое, но глубокое стихотворение о: {}"
         ]
         
+        # LRU-кэш готовых стихотворений по (очищенный запрос, индекс шаблона)
+        self._cache: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._cache_max = POEM_CACHE_MAX_SIZE
+        self._cache_lock = asyncio.Lock()
+        
         logger.info("Генератор стихов инициализирован")
     
     async def generate_poem(self, prompt: str) -> str:
@@ -50,7 +80,18 @@ class PoetryGenerator:
             clean_prompt = self._clean_prompt(prompt)
             
             # Выбираем шаблон для генерации
-            template = self._select_template(clean_prompt)
+            index = self._select_template_index(clean_prompt)
+            template = self.poetry_templates[index]
+            
+            # Проверяем кэш
+            key = (clean_prompt, index)
+            cached_poem = self._cache.get(key)
+            if cached_poem is not None:
+                async with self._cache_lock:
+                    if key in self._cache:
+                        self._cache.move_to_end(key)
+                logger.debug(f"Стихотворение найдено в кэше: {clean_prompt[:30]}...")
+                return cached_poem
             
             # Формируем полный запрос к ИИ
             full_prompt = template.format(clean_prompt)
@@ -62,9 +103,21 @@ class PoetryGenerator:
             # Получаем стихотворение от ИИ
             poem = await self.ai_service.get_creative_response(full_prompt)
             
+            # Ошибку ИИ не форматируем и не кэшируем: при следующем запросе пробуем снова
+            if poem == CREATIVE_ERROR_RESPONSE:
+                logger.warning(f"Не удалось сгенерировать стихотворение на тему: {clean_prompt[:30]}...")
+                return poem
+            
             # Форматируем результат
             formatted_poem = self._format_poem(poem)
             
+            # Сохраняем стихотворение в кэш
+            async with self._cache_lock:
+                self._cache[key] = formatted_poem
+                self._cache.move_to_end(key)
+                if len(self._cache) > self._cache_max:
+                    self._cache.popitem(last=False)
+            
             logger.info(f"Сгенерировано стихотворение на тему: {clean_prompt[:30]}...")
             return formatted_poem
         
@@ -81,16 +134,8 @@ class PoetryGenerator:
         Returns:
             Очищенный запрос
         """
-        # Удаляем фразы типа "напиши стих о", "сочини стихотворение про" и т.д.
-        phrases_to_remove = [
-            "напиши стих", "напиши стихотворение", "сочини стих", "сочини стихотворение",
-            "создай стих", "создай стихотворение", "придумай стих", "придумай стихотворение",
-            "поэт,", "@поэт", "стихотворение о", "стихотворение про", "стих о", "стих про"
-        ]
-        
-        result = prompt.lower()
-        for phrase in phrases_to_remove:
-            result = result.replace(phrase, "")
+        # Удаляем служебные фразы одним проходом регулярного выражения
+        result = CLEAN_PROMPT_PATTERN.sub("", prompt.lower())
         
         # Удаляем лишние пробелы и знаки препинания в начале и конце
         result = result.strip(" ,.!?:;-")
@@ -106,10 +151,20 @@ class PoetryGenerator:
         Returns:
             Шаблон для генерации
         """
-        # Простой алгоритм выбора шаблона на основе длины запроса
-        # В реальном приложении можно использовать более сложную логику
-        index = hash(prompt) % len(self.poetry_templates)
-        return self.poetry_templates[index]
+        return self.poetry_templates[self._select_template_index(prompt)]
+    
+    def _select_template_index(self, prompt: str) -> int:
+        """Выбор индекса шаблона для генерации стихотворения
+        
+        Args:
+            prompt: Очищенный запрос
+            
+        Returns:
+            Индекс шаблона в списке poetry_templates
+        """
+        # Стабильный хэш запроса: в отличие от hash() он не меняется между запусками
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % len(self.poetry_templates)
     
     def _format_poem(self, poem: str) -> str:
         """Форматирование сгенерированного стихотворения
@@ -120,33 +175,12 @@ class PoetryGenerator:
         Returns:
             Отформатированное стихотворение
         """
-        # Удаляем лишние кавычки, если они есть
-        poem = poem.strip('"\' ')
-        
-        # Удаляем лишние пробелы и переносы строк
-        lines = [line.strip() for line in poem.split('\n')]
-        
-        # Удаляем пустые строки
-        lines = [line for line in lines if line]
-        
-        # Собираем стихотворение обратно
-        formatted_poem = '\n'.join(lines)
-        
-        return formatted_poem
+        # Удаляем лишние кавычки, пробелы и пустые строки за один проход
+        stripped_lines = (line.strip() for line in poem.strip('"\' ').splitlines())
+        return '\n'.join(line for line in stripped_lines if line)
     
     def cleanup(self):
         """Очистка временных файлов и ресурсов"""
-        try:
-            # Удаляем все временные файлы
-            for file in self.temp_dir.glob("*"):
-                try:
-                    file.unlink()
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении временного файла {file}: {e}")
-            
-            # Удаляем временную директорию
-            self.temp_dir.rmdir()
-            logger.info("Временные файлы генератора стихов удалены")
-        
-        except Exception as e:
-            logger.error(f"Ошибка при очистке ресурсов генератора стихов: {e}")
\ No newline at end of file
+        # Удаляем временную директорию вместе со всеми файлами
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logger.info("Временные файлы генератора стихов удалены")
\ No newline at end of file
@@ -7,24 +7,56 @@
 """
 
 import os
+import json
+import asyncio
+import hashlib
+import shutil
 import tempfile
-import requests
+import aiohttp
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional, Dict, Any
 from loguru import logger
 
+# Быстрая сериализация JSON (необязательная зависимость, иначе используется стандартный json)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.warning("Библиотека orjson не установлена. Будет использован стандартный модуль json.")
+
 # Импортируем сервисы
-from services.ai_service import AIService
+from services.ai_service import AIService, CREATIVE_ERROR_RESPONSE
 from services.web_automation import WebAutomation
+from services._singletons import get_ai_service, get_web_automation
+
+# Максимальное количество промптов для Suno в кэше
+SUNO_PROMPT_CACHE_MAX_SIZE = 512
+
+
+def _json_dumps(obj: Any) -> str:
+    """Сериализация тела запроса к Suno API в JSON"""
+    return orjson.dumps(obj).decode("utf-8") if ORJSON_AVAILABLE else json.dumps(obj)
+
+
+def _json_loads(data: str) -> Any:
+    """Разбор JSON-ответа Suno API"""
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
 
 
 class SunoIntegration:
     """Класс для интеграции с Suno API"""
     
-    def __init__(self):
-        """Инициализация интеграции с Suno"""
-        self.ai_service = AIService()
-        self.web_automation = WebAutomation()
+    def __init__(self, ai_service: Optional[AIService] = None, web_automation: Optional[WebAutomation] = None):
+        """Инициализация интеграции с Suno
+        
+        Args:
+            ai_service: Общий сервис ИИ (если не передан, создается собственный)
+            web_automation: Общий сервис веб-автоматизации (если не передан, создается собственный)
+        """
+        self.ai_service = ai_service or AIService()
+        self.web_automation = web_automation or WebAutomation()
         self.temp_dir = Path(tempfile.gettempdir()) / "telegram_bot_suno"
         self.temp_dir.mkdir(exist_ok=True)
         
@@ -32,11 +64,49 @@ class SunoIntegration:
         self.api_key = os.getenv("SUNO_API_KEY")
         self.api_url = "https://api.suno.ai/v1/tracks"
         
+        # HTTP-сессия для запросов к Suno API (создается при первом запросе)
+        self.session: Optional[aiohttp.ClientSession] = None
+        
         # Флаг использования веб-интерфейса вместо API
         self.use_web_interface = True
         
+        # LRU-кэш промптов для Suno по хэшу (стихотворение, исходный запрос)
+        self._prompt_cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._prompt_cache_max = SUNO_PROMPT_CACHE_MAX_SIZE
+        
         logger.info("Интеграция с Suno инициализирована")
     
+    @classmethod
+    async def create(cls) -> "SunoIntegration":
+        """Асинхронное создание интеграции с Suno с общими для всех ботов сервисами
+        
+        Returns:
+            Экземпляр интеграции с Suno
+        """
+        ai_service, web_automation = await asyncio.gather(get_ai_service(), get_web_automation())
+        return cls(ai_service, web_automation)
+    
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """Получение HTTP-сессии с пулом соединений к Suno API
+        
+        Returns:
+            Открытая HTTP-сессия
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=30),
+                json_serialize=_json_dumps
+            )
+        return self.session
+    
+    async def close(self):
+        """Закрытие HTTP-сессии"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+    
     async def create_suno_prompt(self, poem: str, original_request: str) -> str:
         """Создание промпта для Suno на основе стихотворения
         
@@ -47,6 +117,14 @@ class SunoIntegration:
         Returns:
             Промпт для Suno
         """
+        # Проверяем кэш
+        key = hashlib.blake2b(f"{poem}\x00{original_request}".encode("utf-8"), digest_size=16).digest()
+        cached_prompt = self._prompt_cache.get(key)
+        if cached_prompt is not None:
+            self._prompt_cache.move_to_end(key)
+            logger.debug("Промпт для Suno найден в кэше")
+            return cached_prompt
+        
         try:
             # Формируем запрос к ИИ для создания промпта
             ai_prompt = f"""Создай музыкальный промпт для Suno AI на основе этого стихотворения:
@@ -62,6 +140,15 @@ class SunoIntegration:
             # Получаем промпт от ИИ
             suno_prompt = await self.ai_service.get_creative_response(ai_prompt)
             
+            # Ошибку ИИ не кэшируем: используется запасной промпт, а следующий запрос пробует снова
+            if suno_prompt == CREATIVE_ERROR_RESPONSE:
+                raise RuntimeError("сервис ИИ не смог создать промпт")
+            
+            # Сохраняем промпт в кэш (только успешно созданный)
+            self._prompt_cache[key] = suno_prompt
+            if len(self._prompt_cache) > self._prompt_cache_max:
+                self._prompt_cache.popitem(last=False)
+            
             logger.info(f"Создан промпт для Suno: {suno_prompt[:50]}...")
             return suno_prompt
         
@@ -108,21 +195,21 @@ class SunoIntegration:
                 "format": "mp3"
             }
             
-            # Отправляем запрос к Suno API
-            response = requests.post(self.api_url, headers=headers, json=data)
-            
-            # Проверяем ответ
-            if response.status_code == 200:
-                track_data = response.json()
-                track_url = track_data.get("url")
-                
-                if track_url:
-                    logger.info(f"Трек успешно создан через API: {track_url}")
-                    return track_url
+            # Отправляем запрос к Suno API через общую сессию
+            session = await self._ensure_session()
+            async with session.post(self.api_url, headers=headers, json=data) as response:
+                # Проверяем ответ
+                if response.status == 200:
+                    track_data = await response.json(loads=_json_loads)
+                    track_url = track_data.get("url")
+                    
+                    if track_url:
+                        logger.info(f"Трек успешно создан через API: {track_url}")
+                        return track_url
+                    else:
+                        logger.error(f"Ошибка при получении URL трека: {track_data}")
                 else:
-                    logger.error(f"Ошибка при получении URL трека: {track_data}")
-            else:
-                logger.error(f"Ошибка при создании трека через API: {response.status_code} - {response.text}")
+                    logger.error(f"Ошибка при создании трека через API: {response.status} - {await response.text()}")
             
             # В случае ошибки возвращаем заглушку
             return self._get_mock_track_url(prompt)
@@ -143,29 +230,15 @@ class SunoIntegration:
         # В реальном приложении здесь можно возвращать ссылку на демо-треки или другие альтернативы
         return "https://suno.ai/examples"
     
-    def cleanup(self):
+    async def cleanup(self):
         """Очистка временных файлов и ресурсов"""
         try:
-            # Закрываем браузер, если он был открыт
-            if self.web_automation:
-                import asyncio
-                try:
-                    asyncio.create_task(self.web_automation.close_browser())
-                except Exception as e:
-                    logger.error(f"Ошибка при закрытии браузера: {e}")
-                
-                # Очищаем ресурсы веб-автоматизации
-                self.web_automation.cleanup()
-            
-            # Удаляем все временные файлы
-            for file in self.temp_dir.glob("*"):
-                try:
-                    file.unlink()
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении временного файла {file}: {e}")
+            # Закрываем HTTP-сессию (браузер и сервис ИИ общие для всех ботов
+            # и освобождаются менеджером ботов)
+            await self.close()
             
-            # Удаляем временную директорию
-            self.temp_dir.rmdir()
+            # Удаляем временную директорию вместе со всеми файлами
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
             logger.info("Временные файлы интеграции с Suno удалены")
         
         except Exception as e:
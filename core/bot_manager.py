@@ -7,6 +7,7 @@
 """
 
 import asyncio
+from pathlib import Path
 from typing import Dict, List, Optional, Any
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
@@ -14,6 +15,26 @@ from loguru import logger
 
 from bots.base_bot import BaseBot
 from core.message_router import MessageRouter
+from core.database import Database
+from services._singletons import get_ai_service, close_services
+
+# Максимальное количество одновременно обрабатываемых голосовых сообщений
+VOICE_MAX_CONCURRENCY = 8
+
+# Приветствие для команды /start
+START_TEMPLATE = (
+    "Привет, {first_name}! 👋\n\n"
+    "Я многофункциональный бот с несколькими помощниками.\n"
+    "Используй /help для получения списка доступных команд."
+)
+
+# Общая часть справки для команды /help (перед списком ботов)
+HELP_PREAMBLE = (
+    "Доступные команды и функции:\n\n"
+    "/start - Начать общение с ботом\n"
+    "/help - Показать это сообщение\n\n"
+    "Доступные боты:\n"
+)
 
 
 class BotManager:
@@ -26,11 +47,28 @@ class BotManager:
             telegram_token: Токен Telegram бота
         """
         self.telegram_token = telegram_token
-        self.application = Application.builder().token(telegram_token).build()
+        self.application = (
+            Application.builder()
+            .token(telegram_token)
+            .post_init(self._on_startup)
+            .post_shutdown(self._on_shutdown)
+            .build()
+        )
         self.bots: Dict[str, BaseBot] = {}
         self.message_router = MessageRouter()
+        self.database = Database()
         self.is_running = False
         
+        # Ограничение количества голосовых сообщений, обрабатываемых в фоне
+        # (создается при первом сообщении, внутри цикла событий приложения)
+        self._voice_sem: Optional[asyncio.Semaphore] = None
+        
+        # Фоновый прогрев сервиса ИИ (запускается в _on_startup, отменяется в _on_shutdown)
+        self._ai_warmup_task: Optional[asyncio.Task] = None
+        
+        # Текст справки (пересобирается только при изменении набора ботов)
+        self._help_text_cache: Optional[str] = None
+        
         # Регистрация базовых обработчиков
         self._register_handlers()
         
@@ -66,6 +104,8 @@ class BotManager:
         
         self.bots[bot.name] = bot
         bot.set_manager(self)
+        self.message_router.register_keywords(bot.name, bot.keywords, bot.direct_prefix)
+        self._help_text_cache = None
         logger.info(f"Бот {bot.name} успешно зарегистрирован")
     
     def get_bot(self, name: str) -> Optional[BaseBot]:
@@ -90,28 +130,22 @@ class BotManager:
     async def _start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
-        await update.message.reply_text(
-            f"Привет, {user.first_name}! 👋\n\n"
-            f"Я многофункциональный бот с несколькими помощниками.\n"
-            f"Используй /help для получения списка доступных команд."
-        )
+        await update.message.reply_text(START_TEMPLATE.format(first_name=user.first_name))
     
     async def _help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
-        help_text = "Доступные команды и функции:\n\n"
-        help_text += "/start - Начать общение с ботом\n"
-        help_text += "/help - Показать это сообщение\n\n"
+        if self._help_text_cache is None:
+            # Собираем справку один раз: общие команды и информация о каждом боте
+            parts = [HELP_PREAMBLE]
+            parts.extend(f"- {bot.name}: {bot.description}\n" for bot in self.bots.values())
+            self._help_text_cache = "".join(parts)
         
-        # Добавляем информацию о каждом зарегистрированном боте
-        help_text += "Доступные боты:\n"
-        for bot in self.bots.values():
-            help_text += f"- {bot.name}: {bot.description}\n"
-        
-        await update.message.reply_text(help_text)
+        await update.message.reply_text(self._help_text_cache)
     
     async def _handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик текстовых сообщений"""
         user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
         message_text = update.message.text
         
         # Определяем, какой бот должен обработать сообщение
@@ -119,14 +153,17 @@ class BotManager:
         
         if target_bot:
             # Передаем сообщение соответствующему боту
-            response = await target_bot.process_text(user_id, message_text, context)
+            response = await target_bot.process_text(user_id, message_text, context, chat_id=chat_id)
+            
+            # Текст ответа отправляется здесь; None означает, что ответ не требуется или
+            # бот уже отправил его в чат сам (например, потоковый ответ ИИ)
             if response:
                 await update.message.reply_text(response)
         else:
             # Если не определен конкретный бот, используем главного бота
             main_bot = self.get_bot("main_bot")
             if main_bot:
-                response = await main_bot.process_text(user_id, message_text, context)
+                response = await main_bot.process_text(user_id, message_text, context, chat_id=chat_id)
                 if response:
                     await update.message.reply_text(response)
             else:
@@ -136,36 +173,47 @@ class BotManager:
     
     async def _handle_voice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик голосовых сообщений"""
-        user_id = update.effective_user.id
         voice_file = await update.message.voice.get_file()
         
-        # Голосовые сообщения всегда обрабатываются главным ботом
-        main_bot = self.get_bot("main_bot")
-        if main_bot:
-            # Отправляем уведомление о начале обработки
-            processing_message = await update.message.reply_text("Обрабатываю голосовое сообщение...")
-            
-            # Обрабатываем голосовое сообщение
-            response = await main_bot.process_voice(user_id, voice_file, context)
-            
-            # Удаляем сообщение о обработке
-            await processing_message.delete()
+        # Обработка идет в фоновой задаче, чтобы обработчик сразу освобождался для новых обновлений;
+        # задача создается через приложение, поэтому при остановке оно дождется ее завершения
+        self.application.create_task(self._process_voice_job(update, context, voice_file), update=update)
+    
+    async def _process_voice_job(self, update: Update, context: ContextTypes.DEFAULT_TYPE, voice_file):
+        """Фоновая обработка голосового сообщения"""
+        if self._voice_sem is None:
+            self._voice_sem = asyncio.Semaphore(VOICE_MAX_CONCURRENCY)
+        async with self._voice_sem:
+            user_id = update.effective_user.id
             
-            # Отправляем ответ
-            if isinstance(response, str):
-                await update.message.reply_text(response)
-            elif isinstance(response, dict) and 'voice_path' in response:
-                # Если ответ содержит путь к голосовому файлу, отправляем его
-                with open(response['voice_path'], 'rb') as voice:
+            # Голосовые сообщения всегда обрабатываются главным ботом
+            main_bot = self.get_bot("main_bot")
+            if main_bot:
+                # Отправляем уведомление о начале обработки
+                processing_message = await update.message.reply_text("Обрабатываю голосовое сообщение...")
+                
+                # Обрабатываем голосовое сообщение
+                response = await main_bot.process_voice(user_id, voice_file, context)
+                
+                # Удаляем сообщение о обработке
+                await processing_message.delete()
+                
+                # Отправляем ответ
+                if isinstance(response, str):
+                    await update.message.reply_text(response)
+                elif isinstance(response, dict) and 'voice_path' in response:
+                    # Если ответ содержит путь к голосовому файлу, отправляем его
+                    # (файл читается в отдельном потоке, чтобы не блокировать цикл событий)
+                    voice = await asyncio.to_thread(Path(response['voice_path']).read_bytes)
                     await update.message.reply_voice(voice)
+                else:
+                    await update.message.reply_text(
+                        "Извините, произошла ошибка при обработке голосового сообщения."
+                    )
             else:
                 await update.message.reply_text(
-                    "Извините, произошла ошибка при обработке голосового сообщения."
+                    "Извините, обработка голосовых сообщений временно недоступна."
                 )
-        else:
-            await update.message.reply_text(
-                "Извините, обработка голосовых сообщений временно недоступна."
-            )
     
     async def _error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
@@ -175,17 +223,51 @@ class BotManager:
                 "Извините, произошла ошибка при обработке вашего запроса. Попробуйте позже."
             )
     
+    async def _on_startup(self, application: Application):
+        """Инициализация всех ботов в цикле событий приложения"""
+        # Запускаем фоновую запись сообщений в базу данных
+        await self.database.start_writer()
+        
+        # Боты инициализируются параллельно: время запуска определяется самым медленным ботом
+        await asyncio.gather(*(bot.initialize() for bot in self.bots.values()))
+        
+        # Локальная модель ИИ загружается в фоне: боты начинают принимать сообщения сразу.
+        # Приложение еще не запущено и не дождется этой задачи, поэтому она хранится
+        # и отменяется при остановке
+        self._ai_warmup_task = asyncio.create_task(self._warmup_ai_service())
+    
+    async def _warmup_ai_service(self):
+        """Прогрев общего сервиса ИИ"""
+        ai_service = await get_ai_service()
+        await ai_service.warmup()
+    
+    async def _on_shutdown(self, application: Application):
+        """Остановка всех ботов в цикле событий приложения"""
+        # Останавливаем прогрев сервиса ИИ, если он еще идет, до освобождения сервисов
+        if self._ai_warmup_task and not self._ai_warmup_task.done():
+            self._ai_warmup_task.cancel()
+            await asyncio.gather(self._ai_warmup_task, return_exceptions=True)
+        
+        # Боты останавливаются параллельно; ошибка одного бота не мешает остановке остальных
+        results = await asyncio.gather(*(bot.shutdown() for bot in self.bots.values()), return_exceptions=True)
+        for bot, result in zip(self.bots.values(), results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка при остановке бота {bot.name}: {result}")
+        
+        # Освобождение общих для всех ботов сервисов (сервис ИИ, браузер)
+        await close_services()
+        
+        # Сохраняем оставшиеся сообщения
+        await self.database.stop_writer()
+    
     def start(self):
         """Запуск менеджера ботов"""
         if self.is_running:
             logger.warning("Менеджер ботов уже запущен")
             return
         
-        # Инициализация всех ботов
-        for bot in self.bots.values():
-            bot.initialize()
-        
-        # Запуск приложения
+        # Запуск приложения (боты инициализируются в _on_startup и
+        # останавливаются в _on_shutdown)
         self.is_running = True
         self.application.run_polling()
     
@@ -195,13 +277,7 @@ class BotManager:
             logger.warning("Менеджер ботов не запущен")
             return
         
-        # Остановка всех ботов
-        for bot in self.bots.values():
-            bot.shutdown()
-        
-        # Остановка приложения
+        # run_polling к этому моменту уже завершил приложение и вызвал _on_shutdown
         self.is_running = False
-        if self.application.running:
-            self.application.stop()
         
         logger.info("Менеджер ботов остановлен")
\ No newline at end of file
@@ -7,14 +7,90 @@
 """
 
 import os
+import atexit
+import asyncio
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 import sqlite3
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, NamedTuple
 from loguru import logger
 
 # Путь к базе данных
 DB_PATH = Path(__file__).parent.parent / "database" / "bot.db"
 
+# Настройки SQLite, применяемые к каждому соединению
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA wal_autocheckpoint=1000",
+)
+
+# Пакетная запись сообщений: максимальный размер пакета и интервал сброса (в секундах)
+MESSAGE_BATCH_SIZE = 100
+MESSAGE_FLUSH_INTERVAL = 0.5
+
+# Максимальная длина текста сообщения, возвращаемого get_user_messages
+MESSAGE_TEXT_PREVIEW_LENGTH = 512
+
+# SQL-запросы (строки создаются один раз при загрузке модуля)
+_SQL_USER_EXISTS = "SELECT user_id FROM users WHERE user_id = ?"
+_SQL_SAVE_USER_UPDATE = """
+UPDATE users SET
+    username = COALESCE(?, username),
+    first_name = COALESCE(?, first_name),
+    last_name = COALESCE(?, last_name),
+    language_code = COALESCE(?, language_code),
+    is_premium = COALESCE(?, is_premium),
+    last_activity = CURRENT_TIMESTAMP
+WHERE user_id = ?
+"""
+_SQL_SAVE_USER_INSERT = """
+INSERT INTO users (
+    user_id, username, first_name, last_name,
+    language_code, is_premium, registration_date, last_activity
+) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+"""
+_SQL_INSERT_MESSAGE = """
+INSERT INTO messages (
+    user_id, message_text, message_type, timestamp, is_bot_message, bot_name
+) VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?, ?)
+"""
+_SQL_TOUCH_USERS = "UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id IN ({placeholders})"
+_SQL_UPSERT_BOT_STATS = """
+INSERT INTO bot_stats (
+    bot_name, request_count, success_count, error_count, last_request
+) VALUES (?, 1, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(bot_name) DO UPDATE SET
+    request_count = request_count + 1,
+    success_count = success_count + excluded.success_count,
+    error_count = error_count + excluded.error_count,
+    last_request = CURRENT_TIMESTAMP
+"""
+_SQL_SELECT_USER = "SELECT * FROM users WHERE user_id = ?"
+_SQL_SELECT_USER_MESSAGES = """
+SELECT id, message_type, timestamp, is_bot_message, bot_name,
+       substr(message_text, 1, ?) AS message_text
+FROM messages
+WHERE user_id = ?
+ORDER BY timestamp DESC
+LIMIT ?
+"""
+_SQL_SELECT_BOT_STATS = "SELECT * FROM bot_stats WHERE bot_name = ?"
+_SQL_SELECT_ALL_BOT_STATS = "SELECT * FROM bot_stats"
+
+
+class MessageRow(NamedTuple):
+    """Сообщение пользователя, возвращаемое get_user_messages"""
+    id: int
+    message_type: str
+    timestamp: str
+    is_bot_message: bool
+    bot_name: Optional[str]
+    message_text: str
+
 
 def init_db():
     """Инициализация базы данных"""
@@ -25,6 +101,9 @@ def init_db():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # Переводим базу в режим WAL (сохраняется в файле базы)
+    cursor.execute("PRAGMA journal_mode=WAL")
+    
     # Создаем таблицы
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
@@ -64,6 +143,15 @@ def init_db():
     )
     """)
     
+    # Уникальный индекс по имени бота нужен для UPSERT в update_bot_stats
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bot_stats_name ON bot_stats(bot_name)")
+    
+    # Индекс для выборки последних сообщений пользователя в get_user_messages
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_user_ts ON messages(user_id, timestamp DESC)")
+    
+    # Индекс для запросов по времени последней активности пользователей
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users(last_activity)")
+    
     # Сохраняем изменения и закрываем соединение
     conn.commit()
     conn.close()
@@ -77,15 +165,71 @@ class Database:
     def __init__(self):
         """Инициализация объекта базы данных"""
         self.db_path = DB_PATH
+        
+        # Постоянное соединение для каждого потока
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        
+        # Очередь сообщений для фоновой пакетной записи
+        self._write_q: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        
+        # Закрываем соединения при завершении процесса
+        atexit.register(self.close)
+        
         logger.info(f"Объект базы данных инициализирован: {self.db_path}")
     
     def _get_connection(self):
         """Получение соединения с базой данных
         
+        Соединение открывается один раз для каждого потока и остается открытым
+        до завершения процесса.
+        
         Returns:
             Соединение с базой данных
         """
-        return sqlite3.connect(self.db_path)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row  # Для получения результатов в виде словаря
+            for pragma in SQLITE_PRAGMAS:
+                conn.execute(pragma)
+            
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        
+        return conn
+    
+    @contextmanager
+    def _conn(self):
+        """Контекст работы с соединением текущего потока
+        
+        Соединение остается открытым после выхода из контекста; при ошибке
+        незавершенная транзакция откатывается.
+        
+        Yields:
+            Соединение с базой данных
+        """
+        conn = self._get_connection()
+        try:
+            yield conn
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    
+    def close(self):
+        """Закрытие всех открытых соединений с базой данных"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.error(f"Ошибка при закрытии соединения с базой данных: {e}")
+            self._connections.clear()
+        self._local = threading.local()
     
     def save_user(self, user_id: int, username: str = None, first_name: str = None, 
                   last_name: str = None, language_code: str = None, is_premium: bool = False):
@@ -100,48 +244,33 @@ class Database:
             is_premium: Флаг премиум-статуса
         """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Проверяем, существует ли пользователь
-            cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-            user_exists = cursor.fetchone()
-            
-            if user_exists:
-                # Обновляем информацию о пользователе
-                cursor.execute("""
-                UPDATE users SET 
-                    username = COALESCE(?, username),
-                    first_name = COALESCE(?, first_name),
-                    last_name = COALESCE(?, last_name),
-                    language_code = COALESCE(?, language_code),
-                    is_premium = COALESCE(?, is_premium),
-                    last_activity = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-                """, (username, first_name, last_name, language_code, is_premium, user_id))
-            else:
-                # Добавляем нового пользователя
-                cursor.execute("""
-                INSERT INTO users (
-                    user_id, username, first_name, last_name, 
-                    language_code, is_premium, registration_date, last_activity
-                ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                """, (user_id, username, first_name, last_name, language_code, is_premium))
-            
-            conn.commit()
-            logger.debug(f"Информация о пользователе {user_id} сохранена")
+            with self._conn() as conn:
+                cursor = conn.cursor()
+                
+                # Проверяем, существует ли пользователь
+                cursor.execute(_SQL_USER_EXISTS, (user_id,))
+                user_exists = cursor.fetchone()
+                
+                if user_exists:
+                    # Обновляем информацию о пользователе
+                    cursor.execute(_SQL_SAVE_USER_UPDATE, (username, first_name, last_name, language_code, is_premium, user_id))
+                else:
+                    # Добавляем нового пользователя
+                    cursor.execute(_SQL_SAVE_USER_INSERT, (user_id, username, first_name, last_name, language_code, is_premium))
+                
+                conn.commit()
+                logger.debug(f"Информация о пользователе {user_id} сохранена")
         
         except Exception as e:
             logger.error(f"Ошибка при сохранении информации о пользователе {user_id}: {e}")
-        
-        finally:
-            if 'conn' in locals():
-                conn.close()
     
     def save_message(self, user_id: int, message_text: str, message_type: str, 
                      is_bot_message: bool = False, bot_name: str = None):
         """Сохранение сообщения
         
+        Если запущена фоновая запись, сообщение ставится в очередь и записывается
+        пакетом вместе с другими; иначе записывается сразу.
+        
         Args:
             user_id: ID пользователя
             message_text: Текст сообщения
@@ -149,31 +278,89 @@ class Database:
             is_bot_message: Флаг сообщения от бота
             bot_name: Имя бота, обработавшего сообщение
         """
+        message = (user_id, message_text, message_type, is_bot_message, bot_name)
+        
+        if self._writer_task and not self._writer_task.done():
+            self._write_q.put_nowait(message)
+        else:
+            self._write_messages([message])
+    
+    def _write_messages(self, messages: List[Tuple[int, str, str, bool, Optional[str]]]):
+        """Запись пакета сообщений одной транзакцией
+        
+        Args:
+            messages: Список кортежей (user_id, message_text, message_type, is_bot_message, bot_name)
+        """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Добавляем сообщение
-            cursor.execute("""
-            INSERT INTO messages (
-                user_id, message_text, message_type, timestamp, is_bot_message, bot_name
-            ) VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?, ?)
-            """, (user_id, message_text, message_type, is_bot_message, bot_name))
-            
-            # Обновляем время последней активности пользователя
-            cursor.execute("""
-            UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?
-            """, (user_id,))
-            
-            conn.commit()
-            logger.debug(f"Сообщение от пользователя {user_id} сохранено")
+            with self._conn() as conn:
+                cursor = conn.cursor()
+                
+                # Добавляем сообщения
+                cursor.executemany(_SQL_INSERT_MESSAGE, messages)
+                
+                # Обновляем время последней активности пользователей одним запросом
+                user_ids = sorted({message[0] for message in messages})
+                placeholders = ", ".join("?" * len(user_ids))
+                cursor.execute(
+                    _SQL_TOUCH_USERS.format(placeholders=placeholders),
+                    user_ids
+                )
+                
+                conn.commit()
+                logger.debug(f"Сохранено сообщений: {len(messages)}")
         
         except Exception as e:
-            logger.error(f"Ошибка при сохранении сообщения от пользователя {user_id}: {e}")
+            logger.error(f"Ошибка при сохранении сообщений ({len(messages)} шт.): {e}")
+    
+    async def start_writer(self):
+        """Запуск фоновой пакетной записи сообщений"""
+        if self._writer_task and not self._writer_task.done():
+            return
+        
+        self._write_q = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+        logger.info("Фоновая запись сообщений запущена")
+    
+    async def stop_writer(self):
+        """Остановка фоновой записи с сохранением оставшихся сообщений"""
+        if not self._writer_task:
+            return
+        
+        # Сигнал завершения: обработчик запишет накопленный пакет и остановится
+        if not self._writer_task.done():
+            self._write_q.put_nowait(None)
+            await self._writer_task
+        self._writer_task = None
         
-        finally:
-            if 'conn' in locals():
-                conn.close()
+        logger.info("Фоновая запись сообщений остановлена")
+    
+    async def _writer_loop(self):
+        """Фоновая задача, записывающая сообщения пакетами"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        
+        while not stopping:
+            # Ждем первое сообщение, затем собираем остальные в течение интервала сброса
+            batch = []
+            message = await self._write_q.get()
+            deadline = loop.time() + MESSAGE_FLUSH_INTERVAL
+            
+            while True:
+                if message is None:
+                    stopping = True
+                    break
+                batch.append(message)
+                
+                timeout = deadline - loop.time()
+                if len(batch) >= MESSAGE_BATCH_SIZE or timeout <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(self._write_q.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+            
+            if batch:
+                await asyncio.to_thread(self._write_messages, batch)
     
     def update_bot_stats(self, bot_name: str, success: bool = True):
         """Обновление статистики бота
@@ -183,55 +370,18 @@ class Database:
             success: Флаг успешного ответа
         """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Проверяем, существует ли запись для бота
-            cursor.execute("SELECT bot_name FROM bot_stats WHERE bot_name = ?", (bot_name,))
-            bot_exists = cursor.fetchone()
-            
-            if bot_exists:
-                # Обновляем статистику
-                if success:
-                    cursor.execute("""
-                    UPDATE bot_stats SET 
-                        request_count = request_count + 1,
-                        success_count = success_count + 1,
-                        last_request = CURRENT_TIMESTAMP
-                    WHERE bot_name = ?
-                    """, (bot_name,))
-                else:
-                    cursor.execute("""
-                    UPDATE bot_stats SET 
-                        request_count = request_count + 1,
-                        error_count = error_count + 1,
-                        last_request = CURRENT_TIMESTAMP
-                    WHERE bot_name = ?
-                    """, (bot_name,))
-            else:
-                # Добавляем новую запись
-                if success:
-                    cursor.execute("""
-                    INSERT INTO bot_stats (
-                        bot_name, request_count, success_count, error_count, last_request
-                    ) VALUES (?, 1, 1, 0, CURRENT_TIMESTAMP)
-                    """, (bot_name,))
-                else:
-                    cursor.execute("""
-                    INSERT INTO bot_stats (
-                        bot_name, request_count, success_count, error_count, last_request
-                    ) VALUES (?, 1, 0, 1, CURRENT_TIMESTAMP)
-                    """, (bot_name,))
-            
-            conn.commit()
-            logger.debug(f"Статистика бота {bot_name} обновлена")
+            with self._conn() as conn:
+                cursor = conn.cursor()
+                
+                # Создаем запись или обновляем существующую одним запросом
+                success_inc, error_inc = (1, 0) if success else (0, 1)
+                cursor.execute(_SQL_UPSERT_BOT_STATS, (bot_name, success_inc, error_inc))
+                
+                conn.commit()
+                logger.debug(f"Статистика бота {bot_name} обновлена")
         
         except Exception as e:
             logger.error(f"Ошибка при обновлении статистики бота {bot_name}: {e}")
-        
-        finally:
-            if 'conn' in locals():
-                conn.close()
     
     def get_user_info(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получение информации о пользователе
@@ -243,31 +393,17 @@ class Database:
             Информация о пользователе или None, если пользователь не найден
         """
         try:
-            conn = self._get_connection()
-            conn.row_factory = sqlite3.Row  # Для получения результатов в виде словаря
-            cursor = conn.cursor()
-            
-            # Получаем информацию о пользователе
-            cursor.execute("""
-            SELECT * FROM users WHERE user_id = ?
-            """, (user_id,))
-            
-            user = cursor.fetchone()
-            
-            if user:
-                return dict(user)
-            else:
-                return None
+            with self._conn() as conn:
+                # Получаем информацию о пользователе
+                user = conn.execute(_SQL_SELECT_USER, (user_id,)).fetchone()
+                
+                return dict(user) if user else None
         
         except Exception as e:
             logger.error(f"Ошибка при получении информации о пользователе {user_id}: {e}")
             return None
-        
-        finally:
-            if 'conn' in locals():
-                conn.close()
     
-    def get_user_messages(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    def get_user_messages(self, user_id: int, limit: int = 10) -> List[MessageRow]:
         """Получение последних сообщений пользователя
         
         Args:
@@ -275,32 +411,21 @@ class Database:
             limit: Максимальное количество сообщений
             
         Returns:
-            Список сообщений
+            Список сообщений (текст обрезается до MESSAGE_TEXT_PREVIEW_LENGTH символов)
         """
         try:
-            conn = self._get_connection()
-            conn.row_factory = sqlite3.Row  # Для получения результатов в виде словаря
-            cursor = conn.cursor()
-            
-            # Получаем последние сообщения пользователя
-            cursor.execute("""
-            SELECT * FROM messages 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-            """, (user_id, limit))
-            
-            messages = cursor.fetchall()
-            
-            return [dict(message) for message in messages]
+            with self._conn() as conn:
+                # Получаем последние сообщения пользователя (только нужные столбцы)
+                rows = conn.execute(_SQL_SELECT_USER_MESSAGES, (MESSAGE_TEXT_PREVIEW_LENGTH, user_id, limit)).fetchall()
+                
+                return [
+                    MessageRow(message_id, message_type, timestamp, bool(is_bot_message), bot_name, message_text)
+                    for message_id, message_type, timestamp, is_bot_message, bot_name, message_text in rows
+                ]
         
         except Exception as e:
             logger.error(f"Ошибка при получении сообщений пользователя {user_id}: {e}")
             return []
-        
-        finally:
-            if 'conn' in locals():
-                conn.close()
     
     def get_bot_stats(self, bot_name: str = None) -> List[Dict[str, Any]]:
         """Получение статистики ботов
@@ -312,29 +437,16 @@ class Database:
             Статистика ботов
         """
         try:
-            conn = self._get_connection()
-            conn.row_factory = sqlite3.Row  # Для получения результатов в виде словаря
-            cursor = conn.cursor()
-            
-            if bot_name:
-                # Получаем статистику для конкретного бота
-                cursor.execute("""
-                SELECT * FROM bot_stats WHERE bot_name = ?
-                """, (bot_name,))
-            else:
-                # Получаем статистику для всех ботов
-                cursor.execute("""
-                SELECT * FROM bot_stats
-                """)
-            
-            stats = cursor.fetchall()
-            
-            return [dict(stat) for stat in stats]
+            with self._conn() as conn:
+                if bot_name:
+                    # Получаем статистику для конкретного бота
+                    stats = conn.execute(_SQL_SELECT_BOT_STATS, (bot_name,)).fetchall()
+                else:
+                    # Получаем статистику для всех ботов
+                    stats = conn.execute(_SQL_SELECT_ALL_BOT_STATS).fetchall()
+                
+                return [dict(stat) for stat in stats]
         
         except Exception as e:
             logger.error(f"Ошибка при получении статистики ботов: {e}")
             return []
-        e
-        finally:
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
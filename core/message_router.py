@@ -7,29 +7,88 @@
 """
 
 import re
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Set, Iterable, Pattern
 from loguru import logger
 
+# Автомат Ахо-Корасик для поиска ключевых слов за один проход (необязательная зависимость)
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+    logger.warning("Библиотека pyahocorasick не установлена. Ключевые слова будут искаться по словам сообщения.")
+
+
+# Слова сообщения (буквы, цифры и подчеркивание)
+TOKEN_PATTERN = re.compile(r"\w+")
+
 
 class MessageRouter:
     """Класс для маршрутизации сообщений между ботами"""
     
     def __init__(self):
         """Инициализация маршрутизатора сообщений"""
-        # Ключевые слова и фразы для определения бота
-        self.poetry_keywords = [
-            r"стих", r"поэм", r"рифм", r"строф", r"сочини", r"напиши стих", 
-            r"музык", r"песн", r"трек", r"мелоди", r"suno"
-        ]
-        
-        # Шаблоны для прямого обращения к ботам
-        self.direct_patterns = {
-            "main_bot": re.compile(r"^@?главный\s+бот[,:].+", re.IGNORECASE | re.DOTALL),
-            "poetry_bot": re.compile(r"^@?поэт[,:].+", re.IGNORECASE | re.DOTALL)
-        }
+        # Ключевые слова (основы слов) -> имя бота; заполняется при регистрации ботов
+        self._kw_index: Dict[str, str] = {}
+        
+        # Длины зарегистрированных основ: слово сообщения проверяется по своим префиксам
+        # этих длин, поэтому "стихотворение" находит основу "стих"
+        self._kw_lengths: List[int] = []
+        
+        # Первые буквы основ: сообщение без этих букв сразу пропускает поиск ключевых слов
+        self._kw_first_chars: Set[str] = set()
+        
+        # Автомат Ахо-Корасик по всем основам (пересобирается при регистрации ботов)
+        self._kw_automaton = None
+        
+        # Префиксы прямого обращения ("главный бот") -> имя бота и общее регулярное
+        # выражение для всех префиксов (пересобирается при регистрации ботов)
+        self._direct_map: Dict[str, str] = {}
+        self._direct_re: Optional[Pattern] = None
+        
+        # Символы, с которых может начинаться прямое обращение ("@", первые буквы префиксов)
+        self._direct_first_chars: Set[str] = {"@"}
         
         logger.info("Маршрутизатор сообщений инициализирован")
     
+    def register_keywords(self, bot_name: str, keywords: Iterable[str], direct_prefix: Optional[str] = None):
+        """Регистрация ключевых слов и префикса прямого обращения бота
+        
+        Args:
+            bot_name: Имя бота
+            keywords: Ключевые слова (основы слов) для бота
+            direct_prefix: Префикс прямого обращения к боту ("поэт, ...")
+        """
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if self._kw_index.get(keyword, bot_name) != bot_name:
+                logger.warning(f"Ключевое слово '{keyword}' уже зарегистрировано для бота {self._kw_index[keyword]}")
+                continue
+            self._kw_index[keyword] = bot_name
+        self._kw_lengths = sorted({len(keyword) for keyword in self._kw_index})
+        self._kw_first_chars = {keyword[0] for keyword in self._kw_index}
+        
+        if AHOCORASICK_AVAILABLE and self._kw_index:
+            automaton = ahocorasick.Automaton()
+            for keyword, name in self._kw_index.items():
+                automaton.add_word(keyword, (len(keyword), name))
+            automaton.make_automaton()
+            self._kw_automaton = automaton
+        
+        if direct_prefix:
+            words = TOKEN_PATTERN.findall(direct_prefix.lower())
+            self._direct_map[" ".join(words)] = bot_name
+            self._direct_first_chars.add(words[0][0])
+            
+            # Одно выражение со всеми префиксами: длинные проверяются первыми
+            alternatives = "|".join(
+                r"\s+".join(map(re.escape, prefix.split()))
+                for prefix in sorted(self._direct_map, key=len, reverse=True)
+            )
+            self._direct_re = re.compile(rf"^@?(?P<bot>{alternatives})[,:].+", re.IGNORECASE | re.DOTALL)
+        
+        logger.debug(f"Для бота {bot_name} зарегистрировано ключевых слов: {len(self._kw_index)}")
+    
     def route_text_message(self, text: str, bots: Dict[str, any]) -> Optional[any]:
         """Определяет, какой бот должен обработать текстовое сообщение
         
@@ -40,17 +99,23 @@ class MessageRouter:
         Returns:
             Экземпляр бота, который должен обработать сообщение, или None
         """
-        # Проверяем прямое обращение к ботам
-        for bot_name, pattern in self.direct_patterns.items():
-            if pattern.match(text) and bot_name in bots:
-                logger.debug(f"Сообщение направлено напрямую боту {bot_name}")
-                return bots[bot_name]
+        low = text.lower()
         
-        # Проверяем ключевые слова для бота стихов
-        if any(re.search(keyword, text, re.IGNORECASE) for keyword in self.poetry_keywords):
-            if "poetry_bot" in bots:
-                logger.debug("Сообщение содержит ключевые слова для бота стихов")
-                return bots["poetry_bot"]
+        # Проверяем прямое обращение к ботам (только если сообщение может с него начинаться)
+        if self._direct_re and low[:1] in self._direct_first_chars:
+            match = self._direct_re.match(text)
+            if match:
+                bot_name = self._direct_map[" ".join(match.group("bot").lower().split())]
+                if bot_name in bots:
+                    logger.debug(f"Сообщение направлено напрямую боту {bot_name}")
+                    return bots[bot_name]
+        
+        # Ищем ключевые слова ботов, если в сообщении есть первые буквы основ
+        if not self._kw_first_chars.isdisjoint(low):
+            bot_name = self._find_keyword_bot(low, bots)
+            if bot_name is not None:
+                logger.debug(f"Сообщение содержит ключевое слово для бота {bot_name}")
+                return bots[bot_name]
         
         # По умолчанию используем главного бота
         if "main_bot" in bots:
@@ -64,4 +129,39 @@ class MessageRouter:
             return first_bot
         
         logger.warning("Нет доступных ботов для обработки сообщения")
-        return None
\ No newline at end of file
+        return None
+    
+    def _find_keyword_bot(self, low: str, bots: Dict[str, any]) -> Optional[str]:
+        """Поиск бота по ключевым словам в сообщении
+        
+        Ключевое слово засчитывается, только если с него начинается слово сообщения.
+        
+        Args:
+            low: Текст сообщения в нижнем регистре
+            bots: Словарь доступных ботов
+            
+        Returns:
+            Имя бота, ключевое слово которого найдено, или None
+        """
+        # Все основы ищутся автоматом за один проход по тексту
+        if self._kw_automaton is not None:
+            for end, (length, bot_name) in self._kw_automaton.iter(low):
+                start = end - length + 1
+                if start > 0 and (low[start - 1].isalnum() or low[start - 1] == "_"):
+                    continue
+                if bot_name in bots:
+                    return bot_name
+            return None
+        
+        # Без автомата каждое слово проверяется по своим префиксам длин основ
+        for token in set(TOKEN_PATTERN.findall(low)):
+            if token[0] not in self._kw_first_chars:
+                continue
+            for length in self._kw_lengths:
+                if length > len(token):
+                    break
+                bot_name = self._kw_index.get(token[:length])
+                if bot_name is not None and bot_name in bots:
+                    return bot_name
+        
+        return None
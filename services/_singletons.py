@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Общие для всех ботов экземпляры сервисов
+Сервис ИИ и веб-автоматизация создаются один раз и разделяются между ботами
+"""
+
+import asyncio
+from typing import Optional
+from loguru import logger
+
+from services.ai_service import AIService
+from services.web_automation import WebAutomation
+
+_ai_service: Optional[AIService] = None
+_web_automation: Optional[WebAutomation] = None
+
+# Блокировки создаются при первом обращении, внутри работающего цикла событий
+_ai_service_lock: Optional[asyncio.Lock] = None
+_web_automation_lock: Optional[asyncio.Lock] = None
+
+
+async def get_ai_service() -> AIService:
+    """Получение общего сервиса ИИ (создается при первом обращении)
+    
+    Returns:
+        Экземпляр сервиса ИИ
+    """
+    global _ai_service, _ai_service_lock
+    if _ai_service is not None:
+        return _ai_service
+    
+    if _ai_service_lock is None:
+        _ai_service_lock = asyncio.Lock()
+    
+    async with _ai_service_lock:
+        if _ai_service is None:
+            _ai_service = await AIService.create()
+    return _ai_service
+
+
+async def get_web_automation() -> WebAutomation:
+    """Получение общего сервиса веб-автоматизации (создается при первом обращении)
+    
+    Returns:
+        Экземпляр сервиса веб-автоматизации
+    """
+    global _web_automation, _web_automation_lock
+    if _web_automation is not None:
+        return _web_automation
+    
+    if _web_automation_lock is None:
+        _web_automation_lock = asyncio.Lock()
+    
+    async with _web_automation_lock:
+        if _web_automation is None:
+            _web_automation = await asyncio.to_thread(WebAutomation)
+    return _web_automation
+
+
+async def close_services():
+    """Освобождение общих сервисов: закрытие браузера и удаление временных файлов"""
+    global _ai_service, _web_automation
+    
+    if _web_automation is not None:
+        await _web_automation.aclose()
+        _web_automation = None
+    
+    if _ai_service is not None:
+        try:
+            await _ai_service.close()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии клиента OpenAI: {e}")
+        _ai_service.cleanup()
+        _ai_service = None
+    
+    logger.info("Общие сервисы освобождены")
@@ -7,21 +7,35 @@
 """
 
 import os
+import re
+import time
+import shutil
+import asyncio
+import hashlib
 import tempfile
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable, NamedTuple
 from loguru import logger
 
-# Для локальных моделей (бесплатный вариант)
+# Для работы с OpenAI API (импортируется при запуске, чтобы первый запрос не ждал импорта)
+try:
+    from openai import AsyncOpenAI
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+    logger.warning("Библиотека openai не установлена. OpenAI API будет недоступен.")
+
+# Для загрузки локальных моделей из Hugging Face Hub
 try:
     from huggingface_hub import hf_hub_download
-    from transformers import pipeline
     HF_AVAILABLE = True
 except ImportError:
     HF_AVAILABLE = False
-    logger.warning("Библиотеки Hugging Face не установлены. Будет использована заглушка.")
+    logger.warning("Библиотека huggingface-hub не установлена. Будет использована заглушка.")
 
-# Для локальных LLM моделей (бесплатный вариант)
+# Для локальных LLM моделей в формате GGUF (бесплатный вариант)
 try:
     from llama_cpp import Llama
     LLAMA_AVAILABLE = True
@@ -29,187 +43,432 @@ except ImportError:
     LLAMA_AVAILABLE = False
     logger.warning("Библиотека llama-cpp-python не установлена. Будет использована заглушка.")
 
+# Временная директория сервиса ИИ (только временные файлы, удаляется при остановке)
+AI_TEMP_DIR = Path(tempfile.gettempdir()) / "telegram_bot_ai"
+
+# Постоянный кэш моделей Hugging Face Hub (стандартное расположение, переживает перезапуски)
+HF_CACHE_DIR = Path(os.getenv("HF_HOME", str(Path.home() / ".cache" / "huggingface"))) / "hub"
+
+# Локальная GGUF-модель (русскоязычная)
+LLAMA_MODEL_REPO = "IlyaGusev/saiga_mistral_7b_gguf"
+
+# Файл модели определяет точность весов. Генерация на CPU упирается в пропускную
+# способность памяти, поэтому скорость почти обратно пропорциональна размеру весов:
+# 4-битная квантизация (q4_K, она же Q4_K_M) примерно вдвое меньше q8_0 и вчетверо
+# меньше fp16 и генерирует в 2-4 раза быстрее; q5_K - чуть точнее и на ~20% медленнее.
+# Файл можно заменить переменной окружения LLM_QUANT_FILE (например, model-q5_K.gguf)
+LLAMA_MODEL_FILE = os.getenv("LLM_QUANT_FILE", "model-q4_K.gguf")
+
+# Максимальное количество потоков llama.cpp: генерация упирается в пропускную
+# способность памяти, и дальнейшее увеличение числа потоков только мешает
+LLAMA_MAX_THREADS = 16
+
+# Количество слоев модели, переносимых на GPU (-1 - все; без GPU-сборки llama.cpp игнорируется).
+# Задается переменной окружения LLAMA_GPU_LAYERS или N_GPU_LAYERS
+LLAMA_GPU_LAYERS = int(os.getenv("LLAMA_GPU_LAYERS", os.getenv("N_GPU_LAYERS", "-1")))
+
+# Максимальное количество одновременных генераций локальной моделью: llama.cpp сам
+# использует все потоки, и параллельные генерации только мешают друг другу
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "1"))
+
+# Ключевые слова для выбора заглушки креативного ответа: стихи и промпты для Suno
+MOCK_POEM_PATTERN = re.compile(r"стих|поэм|рифм", re.IGNORECASE)
+MOCK_MUSIC_PATTERN = re.compile(r"музык|песн|трек|мелоди|suno", re.IGNORECASE)
+
+# Кэш ответов: максимальное количество записей и время жизни записи (в секундах)
+RESPONSE_CACHE_MAX_SIZE = 2048
+RESPONSE_CACHE_TTL = 3600
+
+# Ответы при ошибке генерации (не кэшируются; по ним вызывающий код отличает ошибку от ответа)
+TEXT_ERROR_RESPONSE = "Извините, произошла ошибка при обработке вашего запроса. Попробуйте позже."
+CREATIVE_ERROR_RESPONSE = "Извините, произошла ошибка при создании креативного контента. Попробуйте позже."
+
+# Частота передачи частичного ответа OpenAI при потоковой генерации (каждые N фрагментов)
+STREAM_UPDATE_EVERY = 20
+
+
+class SamplingParams(NamedTuple):
+    """Параметры генерации локальной модели для одного вида запросов"""
+    max_tokens: int
+    temperature: float
+    system_prompt: str
+
+
+# Параметры генерации: обычные ответы и креативные (стихи, промпты для Suno)
+CHAT_SAMPLING = SamplingParams(max_tokens=500, temperature=0.7, system_prompt="Ты полезный ассистент.")
+CREATIVE_SAMPLING = SamplingParams(max_tokens=800, temperature=0.9, system_prompt="Ты креативный ассистент.")
+
+
+def _llama_threads() -> int:
+    """Количество потоков для llama.cpp
+    
+    Берется из переменной окружения LLAMA_THREADS, иначе определяется по числу
+    доступных процессу ядер (с учетом ограничений контейнера).
+    
+    Returns:
+        Количество потоков
+    """
+    threads = os.getenv("LLAMA_THREADS")
+    if threads:
+        return max(1, int(threads))
+    
+    try:
+        cpu_count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpu_count = os.cpu_count() or 4
+    return max(1, min(cpu_count, LLAMA_MAX_THREADS))
+
+
+# Локальная модель загружается один раз на процесс и разделяется всеми экземплярами сервиса
+_llama: Optional["Llama"] = None
+_llama_loaded = False
+_llama_lock = threading.Lock()
+
+
+def _load_llama() -> Optional["Llama"]:
+    """Загрузка локальной LLM модели
+    
+    Returns:
+        Модель или None, если загрузить ее не удалось
+    """
+    try:
+        # Берем модель из локального кэша без обращения к сети, иначе загружаем из Hugging Face Hub
+        logger.info("Загрузка локальной LLM модели...")
+        try:
+            model_path = hf_hub_download(
+                repo_id=LLAMA_MODEL_REPO,
+                filename=LLAMA_MODEL_FILE,
+                cache_dir=str(HF_CACHE_DIR),
+                local_files_only=True
+            )
+        except Exception:
+            model_path = hf_hub_download(
+                repo_id=LLAMA_MODEL_REPO,
+                filename=LLAMA_MODEL_FILE,
+                cache_dir=str(HF_CACHE_DIR)
+            )
+        
+        # Инициализируем модель
+        n_threads = _llama_threads()
+        model = Llama(
+            model_path=model_path,
+            n_ctx=2048,  # Размер контекста
+            n_batch=512,  # Размер пакета при обработке промпта
+            n_threads=n_threads,  # Количество потоков для генерации
+            n_threads_batch=n_threads,  # Количество потоков для обработки промпта
+            # Веса отображаются в память, а не копируются в нее: несколько процессов бота
+            # на одном сервере разделяют один экземпляр весов через страничный кэш ОС
+            # (RSS каждого процесса включает эти страницы, но физически память общая)
+            use_mmap=True,
+            use_mlock=False,  # Не закрепляем страницы: ОС может делить и вытеснять их
+            n_gpu_layers=LLAMA_GPU_LAYERS
+        )
+        
+        logger.info(f"Локальная LLM модель успешно инициализирована (потоков: {n_threads})")
+        return model
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации локальной LLM модели: {e}")
+        return None
+
+
+def _get_llama() -> Optional["Llama"]:
+    """Получение локальной LLM модели (загружается при первом обращении)
+    
+    Returns:
+        Модель или None, если загрузить ее не удалось
+    """
+    global _llama, _llama_loaded
+    with _llama_lock:
+        if not _llama_loaded:
+            _llama = _load_llama()
+            _llama_loaded = True
+    return _llama
+
 
 class AIService:
     """Сервис для взаимодействия с ИИ-моделями"""
     
     def __init__(self):
         """Инициализация сервиса ИИ"""
-        self.temp_dir = Path(tempfile.gettempdir()) / "telegram_bot_ai"
+        self.temp_dir = AI_TEMP_DIR
         self.temp_dir.mkdir(exist_ok=True)
         
         # Получаем API ключи из переменных окружения
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         
-        # Инициализируем модели
-        self.text_model = None
-        self.creative_model = None
+        # Локальная модель используется, если нет ключа OpenAI и установлен llama.cpp;
+        # сама модель загружается при первом обращении или при прогреве
+        self.use_local_model = not self.openai_api_key and LLAMA_AVAILABLE and HF_AVAILABLE
         
-        # Инициализируем кэш ответов
-        self.response_cache = {}
+        # LRU-кэш ответов: ключ -> (время истечения, ответ)
+        self.response_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._cache_max = RESPONSE_CACHE_MAX_SIZE
+        self._cache_ttl = RESPONSE_CACHE_TTL
+        
+        # Выполняющиеся запросы: одинаковые запросы ждут один и тот же ответ
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
+        # Ограничение одновременных генераций (создается внутри цикла событий)
+        self._infer_sem: Optional[asyncio.Semaphore] = None
+        
+        # Асинхронный клиент OpenAI с пулом соединений (создается при первом запросе)
+        self._openai = None
+        
+        # Токены постоянной части промпта локальной модели (по системному промпту)
+        self._prompt_prefix_tokens: Dict[str, List[int]] = {}
+        
+        if self.openai_api_key:
+            logger.info("Найден API ключ OpenAI. Будет использоваться OpenAI API.")
         
         logger.info("Сервис ИИ инициализирован")
+    
+    @classmethod
+    async def create(cls) -> "AIService":
+        """Асинхронное создание сервиса ИИ без блокировки цикла событий
         
-        # Загружаем модели при инициализации
-        self._initialize_models()
+        Returns:
+            Экземпляр сервиса ИИ
+        """
+        return await asyncio.to_thread(cls)
+    
+    @property
+    def text_model(self) -> Optional["Llama"]:
+        """Локальная модель для обычных ответов (общая для всего процесса)"""
+        return _get_llama() if self.use_local_model else None
     
     def _initialize_models(self):
-        """Инициализация ИИ-моделей"""
-        # Если доступен OpenAI API ключ, используем его
-        if self.openai_api_key:
-            logger.info("Найден API ключ OpenAI. Будет использоваться OpenAI API.")
-            return
+        """Инициализация ИИ-моделей (загрузка локальной модели, если она используется)"""
+        if self.use_local_model:
+            _get_llama()
+    
+    async def warmup(self):
+        """Загрузка локальной модели в отдельном потоке, чтобы первый запрос ее не ждал"""
+        await asyncio.to_thread(self._initialize_models)
+    
+    async def _get_model(self) -> Optional["Llama"]:
+        """Получение локальной модели без блокировки цикла событий
         
-        # Если доступны библиотеки Hugging Face, используем локальные модели
-        if HF_AVAILABLE:
-            try:
-                # Инициализируем модель для обычных ответов
-                logger.info("Инициализация локальной модели для обычных ответов...")
-                self.text_model = pipeline(
-                    "text-generation",
-                    model="IlyaGusev/saiga_mistral_7b_gguf",  # Русскоязычная модель
-                    trust_remote_code=True
-                )
-                
-                # Инициализируем модель для креативных ответов
-                logger.info("Инициализация локальной модели для креативных ответов...")
-                self.creative_model = self.text_model  # Используем ту же модель
-                
-                logger.info("Локальные модели успешно инициализированы")
-            except Exception as e:
-                logger.error(f"Ошибка при инициализации локальных моделей: {e}")
-        
-        # Если доступна библиотека llama-cpp-python, используем локальную LLM модель
-        elif LLAMA_AVAILABLE:
-            try:
-                # Загружаем модель из Hugging Face Hub
-                logger.info("Загрузка локальной LLM модели...")
-                model_path = hf_hub_download(
-                    repo_id="IlyaGusev/saiga_mistral_7b_gguf",
-                    filename="model-q4_K.gguf",
-                    cache_dir=str(self.temp_dir)
-                )
-                
-                # Инициализируем модель
-                self.text_model = Llama(
-                    model_path=model_path,
-                    n_ctx=2048,  # Размер контекста
-                    n_threads=4   # Количество потоков
-                )
-                
-                self.creative_model = self.text_model  # Используем ту же модель
-                
-                logger.info("Локальная LLM модель успешно инициализирована")
-            except Exception as e:
-                logger.error(f"Ошибка при инициализации локальной LLM модели: {e}")
+        Returns:
+            Модель или None, если локальная модель не используется или недоступна
+        """
+        if not self.use_local_model:
+            return None
+        if _llama_loaded:
+            return _llama
+        return await asyncio.to_thread(_get_llama)
     
-    async def get_text_response(self, user_id: int, text: str) -> str:
+    async def get_text_response(self, user_id: int, text: str,
+                                on_chunk: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
         """Получение текстового ответа от ИИ
         
         Args:
             user_id: ID пользователя
             text: Текст запроса
+            on_chunk: Обработчик частичного ответа при потоковой генерации через OpenAI
+                (вызывается только для запроса, который запустил генерацию)
             
         Returns:
             Ответ от ИИ
         """
-        # Создаем ключ для кэша
-        cache_key = f"text_{hash(text)}"
-        
-        # Проверяем кэш
-        if cache_key in self.response_cache:
-            logger.debug(f"Ответ найден в кэше: {cache_key}")
-            return self.response_cache[cache_key]
-        
         try:
-            # Если доступен OpenAI API ключ, используем его
-            if self.openai_api_key:
-                response = await self._get_openai_response(text)
-            # Если доступна локальная модель, используем ее
-            elif self.text_model:
-                response = await self._get_local_model_response(text, self.text_model)
-            # Иначе используем заглушку
-            else:
-                response = self._get_mock_response(text)
-            
-            # Сохраняем ответ в кэш
-            self.response_cache[cache_key] = response
-            
-            return response
+            return await self._get_cached_response(
+                self._cache_key("text", text), lambda: self._generate_text_response(text, on_chunk)
+            )
         
         except Exception as e:
             logger.error(f"Ошибка при получении ответа от ИИ: {e}")
-            return "Извините, произошла ошибка при обработке вашего запроса. Попробуйте позже."
+            return TEXT_ERROR_RESPONSE
     
     async def get_creative_response(self, prompt: str) -> str:
         """Получение креативного ответа от ИИ
         
+        Args:
+            prompt: Текст запроса
+            
+        Returns:
+            Креативный ответ от ИИ или CREATIVE_ERROR_RESPONSE в случае ошибки
+        """
+        try:
+            return await self._get_cached_response(
+                self._cache_key("creative", prompt), lambda: self._generate_creative_response(prompt)
+            )
+        
+        except Exception as e:
+            logger.error(f"Ошибка при получении креативного ответа от ИИ: {e}")
+            return CREATIVE_ERROR_RESPONSE
+    
+    async def _generate_text_response(self, text: str,
+                                      on_chunk: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
+        """Генерация текстового ответа без кэша
+        
+        Args:
+            text: Текст запроса
+            on_chunk: Обработчик частичного ответа при потоковой генерации
+            
+        Returns:
+            Ответ от ИИ
+        """
+        # Если доступен OpenAI API ключ, используем его
+        if self.openai_api_key:
+            return await self._get_openai_response(text, on_chunk)
+        
+        # Если доступна локальная модель, используем ее, иначе используем заглушку
+        model = await self._get_model()
+        if model:
+            return await self._get_local_model_response(text, model, CHAT_SAMPLING)
+        return self._get_mock_response(text)
+    
+    async def _generate_creative_response(self, prompt: str) -> str:
+        """Генерация креативного ответа без кэша
+        
         Args:
             prompt: Текст запроса
             
         Returns:
             Креативный ответ от ИИ
         """
-        # Создаем ключ для кэша
-        cache_key = f"creative_{hash(prompt)}"
+        # Если доступен OpenAI API ключ, используем его
+        if self.openai_api_key:
+            return await self._get_openai_creative_response(prompt)
         
-        # Проверяем кэш
-        if cache_key in self.response_cache:
-            logger.debug(f"Креативный ответ найден в кэше: {cache_key}")
-            return self.response_cache[cache_key]
+        # Если доступна локальная модель, используем ее, иначе используем заглушку
+        model = await self._get_model()
+        if model:
+            return await self._get_local_model_response(prompt, model, CREATIVE_SAMPLING)
+        return self._get_mock_creative_response(prompt)
+    
+    @staticmethod
+    def _cache_key(kind: str, text: str) -> str:
+        """Стабильный ключ кэша для запроса
         
-        try:
-            # Если доступен OpenAI API ключ, используем его
-            if self.openai_api_key:
-                response = await self._get_openai_creative_response(prompt)
-            # Если доступна локальная модель, используем ее
-            elif self.creative_model:
-                response = await self._get_local_model_response(prompt, self.creative_model, creative=True)
-            # Иначе используем заглушку
-            else:
-                response = self._get_mock_creative_response(prompt)
+        Args:
+            kind: Тип ответа ("text" или "creative")
+            text: Текст запроса
             
-            # Сохраняем ответ в кэш
-            self.response_cache[cache_key] = response
+        Returns:
+            Ключ кэша (в отличие от hash() не меняется между запусками)
+        """
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+        return f"{kind}_{digest}"
+    
+    async def _get_cached_response(self, cache_key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """Получение ответа из кэша или его генерация
+        
+        Одновременные одинаковые запросы не генерируют ответ повторно, а ждут
+        результата первого запроса. Ошибки генерации пробрасываются ждущим запросам
+        и не кэшируются: текст извинения подставляют get_text_response и
+        get_creative_response уже после кэша.
+        
+        Args:
+            cache_key: Ключ кэша
+            generate: Функция, создающая корутину генерации ответа
             
-            return response
+        Returns:
+            Ответ от ИИ
+        """
+        # Проверяем кэш
+        entry = self.response_cache.get(cache_key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > time.monotonic():
+                self.response_cache.move_to_end(cache_key)
+                logger.debug(f"Ответ найден в кэше: {cache_key}")
+                return response
+            del self.response_cache[cache_key]
         
-        except Exception as e:
-            logger.error(f"Ошибка при получении креативного ответа от ИИ: {e}")
-            return "Извините, произошла ошибка при создании креативного контента. Попробуйте позже."
+        # Присоединяемся к уже выполняющемуся запросу или запускаем новый
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(generate())
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda done: self._on_response_done(cache_key, done))
+        else:
+            logger.debug(f"Ожидание выполняющегося запроса: {cache_key}")
+        
+        # Отмена одного ожидающего не отменяет генерацию для остальных
+        return await asyncio.shield(task)
+    
+    def _on_response_done(self, cache_key: str, task: asyncio.Task):
+        """Сохранение сгенерированного ответа в кэш
+        
+        Args:
+            cache_key: Ключ кэша
+            task: Завершившаяся задача генерации ответа
+        """
+        self._inflight.pop(cache_key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        
+        self.response_cache[cache_key] = (time.monotonic() + self._cache_ttl, task.result())
+        self.response_cache.move_to_end(cache_key)
+        if len(self.response_cache) > self._cache_max:
+            self.response_cache.popitem(last=False)
+    
+    def _get_openai_client(self):
+        """Получение общего асинхронного клиента OpenAI
+        
+        Returns:
+            Экземпляр AsyncOpenAI
+        """
+        if self._openai is None:
+            if not OPENAI_AVAILABLE:
+                raise RuntimeError("Библиотека openai не установлена")
+            self._openai = AsyncOpenAI(api_key=self.openai_api_key, timeout=30, max_retries=2)
+        return self._openai
+    
+    async def close(self):
+        """Закрытие клиента OpenAI и его соединений"""
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
     
-    async def _get_openai_response(self, text: str) -> str:
+    async def _get_openai_response(self, text: str,
+                                   on_chunk: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
         """Получение ответа от OpenAI API
         
+        Ответ запрашивается потоково: накопленный текст периодически передается
+        в on_chunk, не дожидаясь окончания генерации.
+        
         Args:
             text: Текст запроса
+            on_chunk: Обработчик частичного ответа
             
         Returns:
             Ответ от OpenAI API
         """
         try:
-            # Импортируем библиотеку только при необходимости
-            from openai import OpenAI
-            
-            # Создаем клиент OpenAI
-            client = OpenAI(api_key=self.openai_api_key)
-            
-            # Отправляем запрос
-            response = client.chat.completions.create(
+            # Отправляем запрос через общий клиент OpenAI
+            stream = await self._get_openai_client().chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "Ты полезный ассистент для Telegram-бота. Отвечай кратко и по делу."}, 
                     {"role": "user", "content": text}
                 ],
-                max_tokens=500
+                max_tokens=500,
+                stream=True
             )
             
-            # Получаем ответ
-            return response.choices[0].message.content
+            # Собираем ответ из фрагментов
+            buf: List[str] = []
+            async for event in stream:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if not delta:
+                    continue
+                buf.append(delta)
+                if on_chunk and len(buf) % STREAM_UPDATE_EVERY == 0:
+                    # Ошибка отображения частичного ответа не должна прерывать генерацию
+                    try:
+                        await on_chunk("".join(buf))
+                    except Exception as e:
+                        logger.debug(f"Ошибка при передаче частичного ответа: {e}")
+            
+            return "".join(buf)
         
         except Exception as e:
             logger.error(f"Ошибка при запросе к OpenAI API: {e}")
-            return "Извините, у меня проблемы с подключением к ИИ-сервису. Попробуйте позже."
+            raise
     
     async def _get_openai_creative_response(self, prompt: str) -> str:
         """Получение креативного ответа от OpenAI API
@@ -221,14 +480,8 @@ class AIService:
             Креативный ответ от OpenAI API
         """
         try:
-            # Импортируем библиотеку только при необходимости
-            from openai import OpenAI
-            
-            # Создаем клиент OpenAI
-            client = OpenAI(api_key=self.openai_api_key)
-            
-            # Отправляем запрос
-            response = client.chat.completions.create(
+            # Отправляем запрос через общий клиент OpenAI
+            response = await self._get_openai_client().chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "Ты креативный ассистент для Telegram-бота. Создавай оригинальный и творческий контент."}, 
@@ -243,57 +496,61 @@ class AIService:
         
         except Exception as e:
             logger.error(f"Ошибка при запросе к OpenAI API для креативного ответа: {e}")
-            return "Извините, у меня проблемы с подключением к ИИ-сервису. Попробуйте позже."
+            raise
     
-    async def _get_local_model_response(self, text: str, model: Any, creative: bool = False) -> str:
+    async def _get_local_model_response(self, text: str, model: Any, params: SamplingParams = CHAT_SAMPLING) -> str:
         """Получение ответа от локальной модели
         
         Args:
             text: Текст запроса
             model: Модель для генерации ответа
-            creative: Флаг креативного режима
+            params: Параметры генерации
             
         Returns:
             Ответ от локальной модели
         """
         try:
-            # Формируем промпт в зависимости от типа модели
-            if isinstance(model, pipeline):
-                # Для моделей из transformers
-                system_prompt = "Ты креативный ассистент." if creative else "Ты полезный ассистент."
-                prompt = f"{system_prompt}\n\nЗапрос: {text}\n\nОтвет:"
-                
-                # Генерируем ответ
-                result = model(prompt, max_length=500, do_sample=True, temperature=0.9 if creative else 0.7)
-                
-                # Извлекаем текст ответа
-                response = result[0]["generated_text"]
-                
-                # Удаляем промпт из ответа
-                response = response.replace(prompt, "").strip()
-                
-                return response
-            
-            elif LLAMA_AVAILABLE and isinstance(model, Llama):
-                # Для моделей из llama-cpp-python
-                system_prompt = "Ты креативный ассистент." if creative else "Ты полезный ассистент."
-                prompt = f"{system_prompt}\n\nЗапрос: {text}\n\nОтвет:"
-                
-                # Генерируем ответ
-                result = model(prompt, max_tokens=500, temperature=0.9 if creative else 0.7)
-                
-                # Извлекаем текст ответа
-                response = result["choices"][0]["text"]
-                
-                return response
+            if LLAMA_AVAILABLE and isinstance(model, Llama):
+                # Для моделей из llama-cpp-python генерируем ответ в отдельном потоке,
+                # не блокируя цикл событий
+                if self._infer_sem is None:
+                    self._infer_sem = asyncio.Semaphore(LLM_CONCURRENCY)
+                async with self._infer_sem:
+                    return await asyncio.to_thread(self._complete, model, text, params)
             
             else:
                 # Если тип модели неизвестен, используем заглушку
-                return self._get_mock_response(text) if not creative else self._get_mock_creative_response(text)
+                return self._get_mock_creative_response(text) if params is CREATIVE_SAMPLING else self._get_mock_response(text)
         
         except Exception as e:
             logger.error(f"Ошибка при получении ответа от локальной модели: {e}")
-            return "Извините, произошла ошибка при обработке вашего запроса локальной моделью. Попробуйте позже."
+            raise
+    
+    def _complete(self, model: "Llama", text: str, params: SamplingParams) -> str:
+        """Генерация ответа локальной моделью (выполняется в отдельном потоке)
+        
+        Постоянная часть промпта токенизируется один раз; для каждого запроса
+        токенизируется только текст пользователя. llama.cpp возвращает только
+        сгенерированный текст, без промпта.
+        
+        Args:
+            model: Модель llama-cpp-python
+            text: Текст запроса
+            params: Параметры генерации
+            
+        Returns:
+            Ответ от локальной модели
+        """
+        prefix_tokens = self._prompt_prefix_tokens.get(params.system_prompt)
+        if prefix_tokens is None:
+            prefix_tokens = model.tokenize(f"{params.system_prompt}\n\nЗапрос:".encode("utf-8"), add_bos=True)
+            self._prompt_prefix_tokens[params.system_prompt] = prefix_tokens
+        
+        # Токенизатор сам добавляет пробел перед текстом запроса
+        prompt_tokens = prefix_tokens + model.tokenize(f"{text}\n\nОтвет:".encode("utf-8"), add_bos=False)
+        
+        result = model.create_completion(prompt_tokens, max_tokens=params.max_tokens, temperature=params.temperature)
+        return result["choices"][0]["text"]
     
     def _get_mock_response(self, text: str) -> str:
         """Получение заглушки ответа (для тестирования или при отсутствии моделей)
@@ -317,7 +574,7 @@ class AIService:
             Заглушка креативного ответа
         """
         # Заглушка для стихов
-        if any(keyword in prompt.lower() for keyword in ["стих", "поэм", "рифм"]):
+        if MOCK_POEM_PATTERN.search(prompt):
             return """Мысли летят, как птицы в небе,
 Свобода творчества — мой хлеб.
 В словах я нахожу свой путь,
@@ -329,7 +586,7 @@ class AIService:
 Но сердце бьется до зари."""
         
         # Заглушка для промптов Suno
-        elif any(keyword in prompt.lower() for keyword in ["музык", "песн", "трек", "мелоди", "suno"]):
+        elif MOCK_MUSIC_PATTERN.search(prompt):
             return "Создайте атмосферную композицию с элементами электронной музыки и классического фортепиано. Медленный темп, глубокие басы и мечтательная мелодия. Настроение: задумчивое, но с нотками надежды."
         
         # Общая заглушка
@@ -339,16 +596,9 @@ class AIService:
     def cleanup(self):
         """Очистка временных файлов и ресурсов"""
         try:
-            # Удаляем все временные файлы
-            for file in self.temp_dir.glob("*"):
-                try:
-                    file.unlink()
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении временного файла {file}: {e}")
-            
-            # Удаляем временную директорию
-            self.temp_dir.rmdir()
+            # Модели хранятся в постоянном кэше Hugging Face, поэтому временная директория удаляется целиком
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
             logger.info("Временные файлы сервиса ИИ удалены")
         
         except Exception as e:
-            logger.error(f"Ошибка при очистке ресурсов сервиса ИИ: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка при очистке ресурсов сервиса ИИ: {e}")
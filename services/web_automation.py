@@ -7,7 +7,10 @@
 """
 
 import os
+import re
+import random
 import asyncio
+import shutil
 import tempfile
 from pathlib import Path
 from typing import Optional, Dict, Any, List
@@ -22,6 +25,28 @@ except ImportError:
     logger.warning("Библиотека playwright не установлена. Установите её командой: pip install playwright")
     logger.warning("После установки выполните: playwright install chromium")
 
+# Сохраненная сессия Suno (cookies и localStorage) для повторного входа без авторизации;
+# хранится в личной директории данных приложения (не в общей /tmp), чтобы переживать
+# перезапуски и не быть доступной другим пользователям системы
+SUNO_STATE_PATH = Path(os.getenv(
+    "SUNO_STATE_PATH",
+    str(Path(os.getenv("XDG_DATA_HOME", str(Path.home() / ".local" / "share"))) / "telegram_bot" / "suno_state.json")
+))
+
+# Ресурсы, не нужные для автоматизации: не загружаются браузером. Стили оставлены,
+# так как от них зависит видимость элементов, которые ищут селекторы
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
+BLOCKED_URL_PARTS = ("google-analytics", "googletagmanager", "analytics", "doubleclick", "segment.io", "hotjar")
+
+# Время ожидания кнопки логина при проверке необходимости авторизации (в мс)
+LOGIN_PROBE_TIMEOUT = 2000
+
+# Адрес страницы созданного трека
+TRACK_URL_PATTERN = re.compile(r".*/(song|track)/.*")
+
+# Максимальная задержка между повторными попытками создания трека (в секундах)
+RETRY_MAX_DELAY = 30
+
 
 class WebAutomation:
     """Класс для автоматизации веб-интерфейсов"""
@@ -38,6 +63,16 @@ class WebAutomation:
         self.playwright = None
         self.browser = None
         
+        # Общий контекст браузера для всех страниц (хранит авторизацию в Suno)
+        self.context = None
+        
+        # Авторизация в Suno уже проверена в текущем контексте
+        self._logged_in = False
+        
+        # Блокировка запуска браузера: сервис общий для всех ботов, и одновременные запросы
+        # не должны запустить несколько браузеров (создается внутри цикла событий)
+        self._browser_lock: Optional[asyncio.Lock] = None
+        
         logger.info("Сервис веб-автоматизации инициализирован")
     
     async def start_browser(self, headless: bool = True) -> bool:
@@ -63,16 +98,54 @@ class WebAutomation:
                 args=["--disable-dev-shm-usage", "--no-sandbox"]
             )
             
+            # Создаем контекст, восстанавливая сохраненную сессию Suno, если она есть
+            # (пустой файл остается, если сохранение сессии было прервано)
+            has_state = SUNO_STATE_PATH.exists() and SUNO_STATE_PATH.stat().st_size > 0
+            storage_state = str(SUNO_STATE_PATH) if has_state else None
+            context = await self.browser.new_context(storage_state=storage_state)
+            await context.route("**/*", self._route_request)
+            self.context = context
+            self._logged_in = False
+            
             logger.info(f"Браузер успешно запущен (headless={headless})")
             return True
         
         except Exception as e:
             logger.error(f"Ошибка при запуске браузера: {e}")
+            # Закрываем то, что успело запуститься, чтобы следующая попытка начала с нуля
+            await self.close_browser()
             return False
     
+    async def _save_storage_state(self):
+        """Сохранение сессии Suno в файл, доступный только владельцу процесса"""
+        # Директория создается с правами 0700, а файл сессии - заранее с правами 0600,
+        # чтобы cookies ни на миг не оказались в файле с правами по умолчанию
+        SUNO_STATE_PATH.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        os.close(os.open(SUNO_STATE_PATH, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(SUNO_STATE_PATH, 0o600)
+        await self.context.storage_state(path=str(SUNO_STATE_PATH))
+        logger.info("Сессия Suno сохранена")
+    
+    @staticmethod
+    async def _route_request(route):
+        """Обработчик запросов страниц: отбрасывает изображения, шрифты, медиа и аналитику
+        
+        Args:
+            route: Перехваченный запрос Playwright
+        """
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or any(part in request.url for part in BLOCKED_URL_PARTS):
+            await route.abort()
+        else:
+            await route.continue_()
+    
     async def close_browser(self):
         """Закрытие браузера"""
         try:
+            if self.context:
+                await self.context.close()
+                self.context = None
+            
             if self.browser:
                 await self.browser.close()
                 self.browser = None
@@ -91,7 +164,7 @@ class WebAutomation:
         
         Args:
             prompt: Промпт для создания трека
-            max_retries: Максимальное количество попыток
+            max_retries: Максимальное количество повторных попыток
             
         Returns:
             URL созданного трека или None в случае ошибки
@@ -100,60 +173,84 @@ class WebAutomation:
             logger.error("Playwright не установлен. Невозможно создать трек через веб-интерфейс.")
             return None
         
-        # Запускаем браузер, если он еще не запущен
-        if not self.browser:
-            success = await self.start_browser(headless=True)
-            if not success:
-                return None
+        # Запускаем браузер, если он еще не запущен (один раз для всех одновременных запросов);
+        # контекст создается последним, поэтому по нему видно, что запуск завершен
+        if self.context is None:
+            if self._browser_lock is None:
+                self._browser_lock = asyncio.Lock()
+            async with self._browser_lock:
+                if self.context is None:
+                    success = await self.start_browser(headless=True)
+                    if not success:
+                        return None
         
-        try:
-            # Создаем новую страницу
-            page = await self.browser.new_page()
-            
-            # Устанавливаем таймаут
-            page.set_default_timeout(60000)  # 60 секунд
-            
-            # Открываем Suno
-            await page.goto("https://suno.ai/")
-            logger.info("Открыта страница Suno")
-            
-            # Проверяем, нужно ли авторизоваться
-            if await self._check_login_required(page):
-                success = await self._login_to_suno(page)
-                if not success:
-                    logger.error("Не удалось авторизоваться в Suno")
-                    await page.close()
-                    return None
-            
-            # Переходим на страницу создания трека
-            await page.goto("https://suno.ai/create")
-            logger.info("Открыта страница создания трека")
-            
-            # Вводим промпт
-            await page.fill("textarea[placeholder='Describe your song']", prompt)
-            logger.info(f"Введен промпт: {prompt[:50]}...")
-            
-            # Нажимаем кнопку создания трека
-            await page.click("button:has-text('Create')")
-            logger.info("Нажата кнопка создания трека")
-            
-            # Ждем создания трека (может занять некоторое время)
-            track_url = await self._wait_for_track_creation(page)
-            
-            # Закрываем страницу
-            await page.close()
-            
-            return track_url
+        for attempt in range(max_retries + 1):
+            page = None
+            try:
+                # Создаем новую страницу в общем контексте
+                page = await self.context.new_page()
+                
+                # Устанавливаем таймаут
+                page.set_default_timeout(60000)  # 60 секунд
+                
+                # Открываем Suno
+                await page.goto("https://suno.ai/")
+                logger.info("Открыта страница Suno")
+                
+                # Проверяем, нужно ли авторизоваться (после успешной проверки не повторяем ее)
+                if not self._logged_in:
+                    if await self._check_login_required(page):
+                        success = await self._login_to_suno(page)
+                        if not success:
+                            logger.error("Не удалось авторизоваться в Suno")
+                            return None
+                        
+                        # Сохраняем сессию, чтобы не авторизоваться повторно
+                        await self._save_storage_state()
+                    self._logged_in = True
+                
+                # Переходим на страницу создания трека
+                await page.goto("https://suno.ai/create")
+                logger.info("Открыта страница создания трека")
+                
+                # Вводим промпт
+                await page.fill("textarea[placeholder='Describe your song']", prompt)
+                logger.info(f"Введен промпт: {prompt[:50]}...")
+                
+                # Нажимаем кнопку создания трека
+                await page.click("button:has-text('Create')")
+                logger.info("Нажата кнопка создания трека")
+                
+                # Ждем создания трека (может занять некоторое время)
+                track_url = await self._wait_for_track_creation(page)
+                if track_url is None:
+                    # Возможно, истекла сессия: при следующем запросе снова проверяем авторизацию
+                    self._logged_in = False
+                return track_url
+            
+            except Exception as e:
+                logger.error(f"Ошибка при создании трека через веб-интерфейс Suno: {e}")
+                
+                # Результат проверки авторизации не переживает ошибку: сессия могла истечь
+                self._logged_in = False
+                
+                # Пробуем еще раз с экспоненциальной задержкой, если есть попытки
+                retries_left = max_retries - attempt
+                if retries_left > 0:
+                    delay = min(2 ** attempt, RETRY_MAX_DELAY) + random.random()
+                    logger.info(f"Повторная попытка создания трека через {delay:.1f} с ({retries_left} осталось)")
+                    await asyncio.sleep(delay)
+            
+            finally:
+                # Закрываем страницу; ошибка закрытия (упавшая страница или браузер)
+                # не должна прерывать повторные попытки
+                if page is not None:
+                    try:
+                        await page.close()
+                    except Exception as e:
+                        logger.error(f"Ошибка при закрытии страницы Suno: {e}")
         
-        except Exception as e:
-            logger.error(f"Ошибка при создании трека через веб-интерфейс Suno: {e}")
-            
-            # Пробуем еще раз, если есть попытки
-            if max_retries > 0:
-                logger.info(f"Повторная попытка создания трека ({max_retries} осталось)")
-                return await self.create_suno_track(prompt, max_retries - 1)
-            
-            return None
+        return None
     
     async def _check_login_required(self, page: Page) -> bool:
         """Проверка необходимости авторизации
@@ -165,9 +262,12 @@ class WebAutomation:
             True, если требуется авторизация, иначе False
         """
         try:
-            # Проверяем наличие кнопки логина
-            login_button = await page.query_selector("text=Log in")
-            return login_button is not None
+            # Ждем кнопку логина недолго: страница может еще не успеть отрисоваться
+            await page.wait_for_selector("text=Log in", state="visible", timeout=LOGIN_PROBE_TIMEOUT)
+            return True
+        
+        except PlaywrightTimeoutError:
+            return False
         
         except Exception as e:
             logger.error(f"Ошибка при проверке необходимости авторизации: {e}")
@@ -243,20 +343,24 @@ class WebAutomation:
             await page.wait_for_selector("text=Creating your track", timeout=10000)
             logger.info("Началось создание трека")
             
-            # Ждем исчезновения индикатора прогресса (макс. 5 минут)
-            await page.wait_for_selector("text=Creating your track", state="hidden", timeout=300000)
+            # Ждем перехода на страницу трека или исчезновения индикатора прогресса
+            # (макс. 5 минут), в зависимости от того, что произойдет раньше
+            await self._wait_first(
+                page.wait_for_url(TRACK_URL_PATTERN, timeout=300000),
+                page.wait_for_selector("text=Creating your track", state="hidden", timeout=300000)
+            )
             logger.info("Трек создан")
             
             # Получаем URL трека
             # Обычно после создания трека происходит редирект на страницу с треком
             current_url = page.url
             
-            if "track" in current_url:
+            if TRACK_URL_PATTERN.search(current_url):
                 logger.info(f"Получен URL трека: {current_url}")
                 return current_url
             
             # Если редиректа не произошло, ищем ссылку на трек
-            track_link = await page.query_selector("a[href*='track']")
+            track_link = await page.query_selector("a[href*='/song/'], a[href*='/track/']")
             if track_link:
                 href = await track_link.get_attribute("href")
                 full_url = f"https://suno.ai{href}" if href.startswith("/") else href
@@ -274,19 +378,33 @@ class WebAutomation:
             logger.error(f"Ошибка при ожидании создания трека: {e}")
             return None
     
-    def cleanup(self):
-        """Очистка временных файлов и ресурсов"""
+    @staticmethod
+    async def _wait_first(*waiters):
+        """Ожидание первого успешно завершившегося ожидания
+        
+        Остальные ожидания отменяются. Если все ожидания завершились ошибкой,
+        выбрасывается ошибка последнего из них.
+        
+        Args:
+            waiters: Корутины ожидания Playwright
+        """
+        pending = {asyncio.ensure_future(waiter) for waiter in waiters}
         try:
-            # Удаляем все временные файлы
-            for file in self.temp_dir.glob("*"):
-                try:
-                    file.unlink()
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении временного файла {file}: {e}")
-            
-            # Удаляем временную директорию
-            self.temp_dir.rmdir()
-            logger.info("Временные файлы веб-автоматизации удалены")
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return
+            # Все ожидания завершились ошибкой
+            raise task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def aclose(self):
+        """Закрытие браузера и очистка временных файлов"""
+        await self.close_browser()
         
-        except Exception as e:
-            logger.error(f"Ошибка при очистке ресурсов веб-автоматизации: {e}")
\ No newline at end of file
+        # Удаляем временную директорию вместе со всеми файлами
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logger.info("Временные файлы веб-автоматизации удалены")
\ No newline at end of file
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Тесты кэша ответов сервиса ИИ
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("loguru")
+
+from services.ai_service import AIService
+
+
+class FakeStream:
+    """Потоковый ответ OpenAI из заданных фрагментов"""
+    
+    def __init__(self, deltas):
+        self._deltas = iter(deltas)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        try:
+            delta = next(self._deltas)
+        except StopIteration:
+            raise StopAsyncIteration
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+
+class FakeOpenAI:
+    """Клиент OpenAI, считающий запросы; при fail=True каждый запрос завершается ошибкой"""
+    
+    def __init__(self, fail: bool):
+        self.calls = 0
+        self.fail = fail
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+    
+    async def _create(self, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("нет соединения")
+        return FakeStream(["При", "вет"])
+
+
+def make_service(monkeypatch, client: FakeOpenAI) -> AIService:
+    """Сервис ИИ, отправляющий запросы в заданный клиент OpenAI"""
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    service = AIService()
+    service._get_openai_client = lambda: client
+    return service
+
+
+def test_errors_are_not_cached(monkeypatch):
+    client = FakeOpenAI(fail=True)
+    service = make_service(monkeypatch, client)
+    
+    async def run():
+        first = await service.get_text_response(1, "вопрос")
+        second = await service.get_text_response(2, "вопрос")
+        return first, second
+    
+    first, second = asyncio.run(run())
+    
+    assert first.startswith("Извините")
+    assert second.startswith("Извините")
+    assert client.calls == 2
+    assert not service.response_cache
+
+
+def test_successful_responses_are_cached(monkeypatch):
+    client = FakeOpenAI(fail=False)
+    service = make_service(monkeypatch, client)
+    
+    async def run():
+        return await asyncio.gather(*(service.get_text_response(user_id, "вопрос") for user_id in range(3)))
+    
+    assert asyncio.run(run()) == ["Привет"] * 3
+    assert client.calls == 1
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Тесты пакетного распознавания речи в обработчике голосовых сообщений
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("speech_recognition")
+pytest.importorskip("faster_whisper")
+np = pytest.importorskip("numpy")
+
+from bots.main_bot.voice_handler import VoiceHandler, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, WHISPER_CHUNK_SECONDS
+
+
+class FakeBatchedPipeline:
+    """Заглушка BatchedInferencePipeline: вырезает фрагменты так же, как faster-whisper"""
+    
+    def __init__(self):
+        self.clip_timestamps = []
+    
+    def transcribe(self, audio, clip_timestamps, **kwargs):
+        self.clip_timestamps = clip_timestamps
+        segments = []
+        for index, chunk in enumerate(clip_timestamps):
+            # collect_chunks в faster-whisper берет срез сигнала по номерам отсчетов
+            clip = audio[chunk["start"]:chunk["end"]]
+            assert len(clip) == chunk["end"] - chunk["start"]
+            segments.append(SimpleNamespace(start=chunk["start"] / PCM_SAMPLE_RATE, text=f" фрагмент {index}"))
+        return iter(segments), None
+
+
+def make_handler(pipeline: FakeBatchedPipeline) -> VoiceHandler:
+    """Обработчик без загрузки модели Whisper"""
+    handler = VoiceHandler.__new__(VoiceHandler)
+    handler._executor = ThreadPoolExecutor(max_workers=1)
+    handler.model = None
+    handler.batched = pipeline
+    handler._pending = None
+    handler._batch_task = None
+    return handler
+
+
+def make_pcm(seconds: float) -> bytes:
+    """PCM-сигнал заданной длительности"""
+    return bytes(int(seconds * PCM_SAMPLE_RATE) * PCM_SAMPLE_WIDTH)
+
+
+def test_queued_clips_are_recognized_separately():
+    pipeline = FakeBatchedPipeline()
+    handler = make_handler(pipeline)
+    
+    async def run():
+        return await asyncio.gather(
+            handler._enqueue_for_batch(make_pcm(1.5)),
+            handler._enqueue_for_batch(make_pcm(2.25))
+        )
+    
+    try:
+        texts = asyncio.run(run())
+    finally:
+        handler._executor.shutdown(wait=False)
+    
+    assert texts == ["фрагмент 0", "фрагмент 1"]
+    assert pipeline.clip_timestamps == [
+        {"start": 0, "end": 24000},
+        {"start": 24000, "end": 60000}
+    ]
+    assert all(isinstance(value, int) for chunk in pipeline.clip_timestamps for value in chunk.values())
+
+
+class FakeWhisperModel:
+    """Заглушка WhisperModel, которая ничего не распознает (тишина, шум, музыка)"""
+    
+    def __init__(self):
+        self.window_lengths = []
+    
+    def transcribe(self, audio, **kwargs):
+        self.window_lengths.append(len(audio))
+        return iter([]), None
+
+
+def test_streaming_window_stays_bounded_without_words():
+    model = FakeWhisperModel()
+    handler = make_handler(FakeBatchedPipeline())
+    handler.model = model
+    
+    async def pcm_chunks():
+        for _ in range(90):
+            yield make_pcm(1.0)
+    
+    try:
+        text = asyncio.run(handler.speech_to_text_streaming(pcm_chunks()))
+    finally:
+        handler._executor.shutdown(wait=False)
+    
+    assert text == ""
+    assert len(model.window_lengths) > 40
+    assert max(model.window_lengths) <= WHISPER_CHUNK_SECONDS * PCM_SAMPLE_RATE